@@ -0,0 +1,123 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional
+
+from metrics import Counter, Gauge, Histogram
+
+# Limit how many slow requests a worker runs at once so they can't take every
+# threadpool thread (40 by default) away from cheap endpoints
+ADMISSION_CONTROL = os.environ.get("ADMISSION_CONTROL", "1") == "1"
+# path=concurrency:queue:max_wait_seconds, comma separated; overrides the defaults below
+ADMISSION_LIMITS = os.environ.get("ADMISSION_LIMITS", "")
+
+DEFAULT_LIMITS = {
+    "/recommend/": (4, 8, 2.0),
+    "/fetch_movies/": (4, 8, 2.0),
+    "/reindex/": (1, 0, 0.0),
+    "/search/": (8, 16, 2.0),
+    "/search_batch/": (2, 4, 5.0),
+    "/similar/": (8, 16, 2.0),
+}
+
+ADMISSION_IN_FLIGHT = Gauge("admission_in_flight", "Requests running under each route's concurrency limit", ["route"])
+ADMISSION_QUEUE_DEPTH = Gauge("admission_queue_depth", "Requests waiting for a slot on each route", ["route"])
+ADMISSION_SHED = Counter("admission_shed_total", "Requests over a route's limit, by why they were not admitted", ["route", "reason"])
+ADMISSION_DEGRADED = Counter("admission_degraded_total", "Shed requests answered from cached or partial data", ["route"])
+ADMISSION_WAIT = Histogram("admission_wait_seconds", "Time admitted requests waited for a slot", ["route"])
+
+class Gate:
+    """Concurrency limit with a bounded FIFO queue for one route
+
+    Only used from the event loop, so the counters need no lock.
+    """
+
+    def __init__(self, route: str, limit: int, queue: int, max_wait: float):
+        self.route = route
+        self.limit = max(1, limit)
+        self.queue = max(0, queue)
+        self.max_wait = max_wait
+        self.retry_after = max(1, math.ceil(max_wait))
+        self.active = 0
+        self._waiters: "deque[asyncio.Future]" = deque()
+        self.degrade: Optional[Callable[..., Awaitable]] = None
+
+    def _publish(self):
+        ADMISSION_IN_FLIGHT.set(self.active, route=self.route)
+        ADMISSION_QUEUE_DEPTH.set(len(self._waiters), route=self.route)
+
+    async def acquire(self) -> Optional[str]:
+        """None once a slot is held, otherwise why the request was shed"""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self._publish()
+            return None
+        if len(self._waiters) >= self.queue:
+            return "queue_full"
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._publish()
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, self.max_wait)
+        except asyncio.TimeoutError:
+            if not (waiter.done() and not waiter.cancelled()):
+                return "timeout"
+            # The slot was handed over just as the wait ran out, keep it
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            self._publish()
+        ADMISSION_WAIT.observe(time.perf_counter() - start, route=self.route)
+        return None
+
+    def release(self):
+        # Hand the slot straight to the oldest waiter that is still waiting
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                self._publish()
+                return
+        self.active -= 1
+        self._publish()
+
+def _parse_limits(spec: str) -> Dict[str, tuple]:
+    limits = dict(DEFAULT_LIMITS)
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        path, _, values = item.partition("=")
+        limit, queue, max_wait = (values.split(":") + ["0", "0"])[:3]
+        limits[path.strip()] = (int(limit), int(queue), float(max_wait))
+    return limits
+
+gates: Dict[str, Gate] = {
+    path: Gate(path, *values) for path, values in _parse_limits(ADMISSION_LIMITS).items()
+} if ADMISSION_CONTROL else {}
+
+def gate_for(path: str) -> Optional[Gate]:
+    return gates.get(path)
+
+def degraded(path: str):
+    """Register an async fallback (request -> response or None) used instead of a 503 for path"""
+    def register(handler):
+        gate = gates.get(path)
+        if gate is not None:
+            gate.degrade = handler
+        return handler
+    return register
+
+def status() -> Dict[str, Dict[str, float]]:
+    """Current load and limits per gated route"""
+    return {
+        path: {
+            "in_flight": gate.active,
+            "queued": len(gate._waiters),
+            "limit": gate.limit,
+            "queue": gate.queue,
+            "max_wait": gate.max_wait,
+        }
+        for path, gate in gates.items()
+    }
@@ -0,0 +1,120 @@
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any
+from urllib.parse import urlparse, parse_qs
+
+GENRES = ["Drama", "Comedy", "Action", "Thriller", "Sci-Fi", "Romance", "Horror", "Adventure", "Crime", "Animation"]
+WORDS = ["lost", "city", "night", "river", "dream", "shadow", "storm", "garden", "machine", "voyage",
+         "secret", "winter", "empire", "signal", "harbor", "mirror", "echo", "frontier", "orbit", "legacy"]
+
+def fake_movie(seed_text: str) -> Dict[str, Any]:
+    """Deterministic OMDb-style record derived from a title or id"""
+    seed = zlib.crc32(seed_text.lower().encode())
+    rng = random.Random(seed)
+    title = seed_text if not seed_text.startswith("tt") else " ".join(rng.sample(WORDS, 2)).title()
+    return {
+        "Title": title,
+        "Year": str(rng.randint(1950, 2024)),
+        "Genre": ", ".join(rng.sample(GENRES, 2)),
+        "Director": f"Director {seed % 997}",
+        "Actors": ", ".join(f"Actor {rng.randint(1, 5000)}" for _ in range(3)),
+        "Plot": " ".join(rng.choice(WORDS) for _ in range(40)),
+        "Poster": f"https://m.media-amazon.com/images/M/fake{seed}.jpg",
+        "imdbRating": f"{rng.uniform(3, 9.5):.1f}",
+        "imdbID": seed_text if seed_text.startswith("tt") else f"tt{seed % 10_000_000:07d}",
+        "Type": "movie",
+        "Response": "True",
+    }
+
+class FakeOmdbHandler(BaseHTTPRequestHandler):
+    """Answers t=, i= and s= queries like OMDb, with injected latency and errors"""
+    server_version = "FakeOMDb/1.0"
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output clean
+
+    def do_GET(self):
+        config = self.server.config
+        with self.server.stats_lock:
+            self.server.stats["requests"] += 1
+
+        latency_ms = config["latency_ms"] + random.uniform(0, config["jitter_ms"])
+        if latency_ms > 0:
+            time.sleep(latency_ms / 1000)
+
+        roll = random.random()
+        if roll < config["error_rate"]:
+            with self.server.stats_lock:
+                self.server.stats["errors"] += 1
+            self.send_response(503)
+            self.end_headers()
+            return
+        if roll < config["error_rate"] + config["not_found_rate"]:
+            self._send_json({"Response": "False", "Error": "Movie not found!"})
+            return
+
+        params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+        if "t" in params:
+            self._send_json(fake_movie(params["t"]))
+        elif "i" in params:
+            self._send_json(fake_movie(params["i"]))
+        elif "s" in params:
+            page = int(params.get("page", 1))
+            results = []
+            for n in range(10):
+                movie = fake_movie(f"{params['s']} {page}-{n}")
+                results.append({key: movie[key] for key in ("Title", "Year", "imdbID", "Type", "Poster")})
+            self._send_json({"Search": results, "totalResults": "50", "Response": "True"})
+        else:
+            self._send_json({"Response": "False", "Error": "Incorrect IMDb ID."})
+
+    def _send_json(self, payload: Dict[str, Any]):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def start_fake_omdb(port: int = 0, latency_ms: float = 0, jitter_ms: float = 0,
+                    error_rate: float = 0.0, not_found_rate: float = 0.0) -> ThreadingHTTPServer:
+    """Run the stand-in server on a background thread; port 0 picks a free port"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeOmdbHandler)
+    server.daemon_threads = True
+    server.config = {
+        "latency_ms": latency_ms,
+        "jitter_ms": jitter_ms,
+        "error_rate": error_rate,
+        "not_found_rate": not_found_rate,
+    }
+    server.stats = {"requests": 0, "errors": 0}
+    server.stats_lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, name="fake-omdb", daemon=True).start()
+    return server
+
+def server_url(server: ThreadingHTTPServer) -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/"
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local OMDb stand-in for benchmarks")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--not-found-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    fake = start_fake_omdb(args.port, args.latency_ms, args.jitter_ms, args.error_rate, args.not_found_rate)
+    print(f"Fake OMDb listening on {server_url(fake)}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.shutdown()
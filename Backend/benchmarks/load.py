@@ -0,0 +1,141 @@
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, List, Tuple
+
+import requests
+
+from benchmarks.fake_omdb import start_fake_omdb, server_url
+from benchmarks.seed import seed_catalog, seed_users, BENCH_PASSWORD
+from benchmarks.stats import summarize
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RECOMMEND_QUERIES = [
+    "movie about a boy on a boat with a tiger",
+    "dreams within dreams",
+    "space travel through a wormhole",
+    "prison escape drama",
+    "robots fall in love",
+    "heist in a casino",
+]
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_app(data_dir: str, omdb_url: str, workers: int = 1, extra_env: Dict[str, str] = None) -> Tuple[subprocess.Popen, str]:
+    """Start the API under uvicorn with data_dir as its working directory"""
+    port = _free_port()
+    env = os.environ.copy()
+    env.update({
+        "PYTHONPATH": BACKEND_DIR + os.pathsep + env.get("PYTHONPATH", ""),
+        "OMDB_BASE_URL": omdb_url,
+        "LOG_LEVEL": "WARNING",
+    })
+    env.update(extra_env or {})
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=data_dir, env=env,
+    )
+
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("API process exited during startup")
+        try:
+            requests.get(f"{base_url}/startup_report/", timeout=1)
+            return process, base_url
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("API did not become ready within 60s")
+
+def run_load(make_request: Callable[[requests.Session, int], requests.Response],
+             total: int, concurrency: int) -> Dict[str, Any]:
+    """Fire total requests from concurrency threads and summarize latencies"""
+    local = threading.local()
+    latencies: List[float] = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def one(i: int):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            response = make_request(session, i)
+            failed = response.status_code >= 400
+        except requests.RequestException:
+            failed = True
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if failed:
+                errors[0] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    return summarize(latencies, time.perf_counter() - start, errors[0])
+
+def login(base_url: str, username: str) -> str:
+    response = requests.post(f"{base_url}/token", data={"username": username, "password": BENCH_PASSWORD}, timeout=30)
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+def benchmark_size(movies_per_user: int, users: int, requests_per_endpoint: int, concurrency: int,
+                   omdb_latency_ms: float, omdb_jitter_ms: float, omdb_error_rate: float,
+                   workers: int, with_search: bool) -> Dict[str, Any]:
+    """Seed one collection size, start the app and load every endpoint"""
+    fake = start_fake_omdb(latency_ms=omdb_latency_ms, jitter_ms=omdb_jitter_ms, error_rate=omdb_error_rate)
+    results: Dict[str, Any] = {}
+    with tempfile.TemporaryDirectory(prefix="moviebench-") as data_dir:
+        seed_catalog(data_dir, movies_per_user)
+        usernames = seed_users(data_dir, users, movies_per_user)
+        process, base_url = start_app(data_dir, server_url(fake), workers)
+        try:
+            tokens = [login(base_url, name) for name in usernames]
+
+            def auth(i):
+                return {"Authorization": f"Bearer {tokens[i % len(tokens)]}"}
+
+            results["/token"] = run_load(
+                lambda s, i: s.post(f"{base_url}/token",
+                                    data={"username": usernames[i % len(usernames)], "password": BENCH_PASSWORD}),
+                requests_per_endpoint, concurrency)
+            results["/movies/"] = run_load(
+                lambda s, i: s.get(f"{base_url}/movies/", headers=auth(i)),
+                requests_per_endpoint, concurrency)
+            results["/add_movie/"] = run_load(
+                lambda s, i: s.post(f"{base_url}/add_movie/", params={"movie_name": f"Bench Added {i}"}, headers=auth(i)),
+                requests_per_endpoint, concurrency)
+            results["/recommend/"] = run_load(
+                lambda s, i: s.get(f"{base_url}/recommend/",
+                                   params={"query": RECOMMEND_QUERIES[i % len(RECOMMEND_QUERIES)], "top_k": 5}),
+                max(1, requests_per_endpoint // 10), concurrency)
+
+            if with_search:
+                # Reindexing loads the embedding model, so it's opt-in
+                reindex_start = time.perf_counter()
+                requests.post(f"{base_url}/reindex/", timeout=3600).raise_for_status()
+                results["/reindex/"] = {"elapsed_sec": round(time.perf_counter() - reindex_start, 4)}
+                results["/search/"] = run_load(
+                    lambda s, i: s.get(f"{base_url}/search/", params={"query": RECOMMEND_QUERIES[i % len(RECOMMEND_QUERIES)]}),
+                    requests_per_endpoint, concurrency)
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+            fake.shutdown()
+
+    results["omdb_upstream"] = dict(fake.stats)
+    return results
@@ -0,0 +1,112 @@
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Dict, Any, List
+
+from benchmarks.seed import synthetic_movies
+from benchmarks.stats import time_calls
+
+@contextmanager
+def _working_dir(path: str):
+    """Storage modules use relative paths, so benchmarks run inside a scratch directory"""
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+def bench_storage(movie_count: int, iterations: int) -> Dict[str, Any]:
+    """Guest catalog functions in storage.py"""
+    import storage
+
+    movies = synthetic_movies(movie_count)
+    titles = [movie["title"] for movie in movies]
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="moviebench-") as data_dir, _working_dir(data_dir):
+        storage.save_movies(movies)
+        results["save_movies"] = time_calls(lambda i: storage.save_movies(movies), iterations)
+        results["load_movies"] = time_calls(lambda i: storage.load_movies(), iterations)
+        results["update_movie"] = time_calls(
+            lambda i: storage.update_movie(titles[i % len(titles)], {"watched": True}), iterations)
+        results["add_movie"] = time_calls(
+            lambda i: storage.add_movie({"title": f"Micro Added {i}", "description": "", "rating": 0.0}), iterations)
+        results["delete_movie"] = time_calls(
+            lambda i: storage.delete_movie(f"Micro Added {i}"), iterations)
+    return results
+
+def bench_user_db(movie_count: int, iterations: int) -> Dict[str, Any]:
+    """Per-user collection functions in user_db.py"""
+    import user_db
+
+    movies = synthetic_movies(movie_count)
+    titles = [movie["title"] for movie in movies]
+    user_id = "micro-bench-user"
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="moviebench-") as data_dir, _working_dir(data_dir):
+        user_db.save_user_movies(user_id, movies)
+        results["get_user_movies"] = time_calls(lambda i: user_db.get_user_movies(user_id), iterations)
+        results["update_user_movie"] = time_calls(
+            lambda i: user_db.update_user_movie(user_id, titles[i % len(titles)], {"notes": f"note {i}"}), iterations)
+        results["add_user_movie"] = time_calls(
+            lambda i: user_db.add_user_movie(user_id, {"title": f"Micro Added {i}", "description": "", "rating": 0.0}),
+            iterations)
+        results["delete_user_movie"] = time_calls(
+            lambda i: user_db.delete_user_movie(user_id, f"Micro Added {i}"), iterations)
+    return results
+
+def _per_thousand(stats: Dict[str, float], movie_count: int) -> Dict[str, float]:
+    """Latency stats scaled to the cost per 1k movies"""
+    scale = 1000 / max(movie_count, 1)
+    scaled = dict(stats)
+    for key in ("p50_ms", "p90_ms", "p99_ms", "max_ms"):
+        scaled[key + "_per_1k"] = round(stats[key] * scale, 4)
+    return scaled
+
+def bench_serialization(movie_count: int, iterations: int) -> Dict[str, Any]:
+    """Encoding a movie list, before (json + indent / FastAPI response_model) and after (fast_json)"""
+    import json
+    import fast_json
+    from fastapi.encoders import jsonable_encoder
+    from pydantic import parse_obj_as
+
+    movies = synthetic_movies(movie_count)
+    pretty = json.dumps(movies, indent=2)
+    compact = fast_json.dumps(movies)
+
+    def response_model_path(i):
+        # What FastAPI did for response_model=List[Dict[str, Any]]
+        validated = parse_obj_as(List[Dict[str, Any]], movies)
+        json.dumps(jsonable_encoder(validated), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    runs = {
+        "disk_encode_before": lambda i: json.dumps(movies, indent=2),
+        "disk_encode_after": lambda i: fast_json.dumps(movies),
+        "disk_decode_before": lambda i: json.loads(pretty),
+        "disk_decode_after": lambda i: fast_json.loads(compact),
+        "response_before": response_model_path,
+        "response_after": lambda i: fast_json.dumps(movies),
+    }
+    results = {name: _per_thousand(time_calls(func, iterations), movie_count) for name, func in runs.items()}
+    results["bytes_before"] = len(pretty.encode("utf-8"))
+    results["bytes_after"] = len(compact)
+    results["orjson"] = fast_json.orjson is not None
+    return results
+
+def bench_vector_search(movie_count: int, iterations: int) -> Dict[str, Any]:
+    """index_movies and search_movies, including the one-off model load"""
+    import vector_search
+
+    movies = synthetic_movies(movie_count)
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="moviebench-") as data_dir, _working_dir(data_dir):
+        results["model_load"] = time_calls(lambda i: vector_search.get_model(), 1)
+        results["index_movies"] = time_calls(lambda i: vector_search.index_movies(movies), 1)
+        results["search_movies"] = time_calls(
+            lambda i: vector_search.search_movies(movies[i % len(movies)]["description"]), iterations)
+        # 64 queries per call; compare with 64x the single-query latency
+        queries = [movie["description"] for movie in movies]
+        results["search_movies_batch_64"] = time_calls(
+            lambda i: vector_search.search_movies_batch([queries[(i * 64 + n) % len(queries)] for n in range(64)]),
+            iterations)
+    return results
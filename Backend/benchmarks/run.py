@@ -0,0 +1,123 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Dict, Any
+
+from benchmarks import micro
+
+RESULTS_DIR = "bench_results"
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def _metadata(args: argparse.Namespace) -> Dict[str, Any]:
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key != "func"},
+    }
+
+def run_load(args: argparse.Namespace) -> Dict[str, Any]:
+    from benchmarks.load import benchmark_size
+
+    results = {}
+    for size in args.sizes:
+        print(f"Load benchmark: {size} movies per user...")
+        results[str(size)] = benchmark_size(
+            movies_per_user=size, users=args.users, requests_per_endpoint=args.requests,
+            concurrency=args.concurrency, omdb_latency_ms=args.omdb_latency_ms,
+            omdb_jitter_ms=args.omdb_jitter_ms, omdb_error_rate=args.omdb_error_rate,
+            workers=args.workers, with_search=args.with_search,
+        )
+    return results
+
+def run_micro(args: argparse.Namespace) -> Dict[str, Any]:
+    results = {}
+    for size in args.sizes:
+        print(f"Micro benchmarks: {size} movies...")
+        size_results = {
+            "storage": micro.bench_storage(size, args.iterations),
+            "user_db": micro.bench_user_db(size, args.iterations),
+            "serialization": micro.bench_serialization(size, args.iterations),
+        }
+        if args.with_search:
+            size_results["vector_search"] = micro.bench_vector_search(size, args.iterations)
+        results[str(size)] = size_results
+    return results
+
+def _flatten(results: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}/{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(_flatten(value, path))
+        elif isinstance(value, (int, float)):
+            flat[path] = value
+    return flat
+
+def compare(baseline_path: str, candidate_path: str, metric_suffixes=("p50_ms", "p99_ms", "p50_ms_per_1k", "throughput_per_sec")):
+    """Print per-metric change between two result files"""
+    with open(baseline_path) as f:
+        baseline = _flatten(json.load(f)["results"])
+    with open(candidate_path) as f:
+        candidate = _flatten(json.load(f)["results"])
+
+    for key in sorted(baseline.keys() & candidate.keys()):
+        if not key.endswith(metric_suffixes) or not baseline[key]:
+            continue
+        change = (candidate[key] - baseline[key]) / baseline[key] * 100
+        print(f"{key:70s} {baseline[key]:>12.3f} -> {candidate[key]:>12.3f} ({change:+.1f}%)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Movie Notes API benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def sizes(value: str):
+        return [int(size) for size in value.split(",")]
+
+    load_parser = subparsers.add_parser("load", help="HTTP load against the API with a fake OMDb")
+    load_parser.add_argument("--sizes", type=sizes, default=[10, 1000, 10000], help="Movies per user, e.g. 10,1000,100000")
+    load_parser.add_argument("--users", type=int, default=10)
+    load_parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint")
+    load_parser.add_argument("--concurrency", type=int, default=8)
+    load_parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    load_parser.add_argument("--omdb-latency-ms", type=float, default=50)
+    load_parser.add_argument("--omdb-jitter-ms", type=float, default=20)
+    load_parser.add_argument("--omdb-error-rate", type=float, default=0.0)
+    load_parser.add_argument("--with-search", action="store_true", help="Also reindex and load /search/ (loads the model)")
+    load_parser.set_defaults(func=run_load)
+
+    micro_parser = subparsers.add_parser("micro", help="In-process benchmarks of storage and search functions")
+    micro_parser.add_argument("--sizes", type=sizes, default=[10, 1000, 10000])
+    micro_parser.add_argument("--iterations", type=int, default=50)
+    micro_parser.add_argument("--with-search", action="store_true", help="Include index_movies and search_movies")
+    micro_parser.set_defaults(func=run_micro)
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+
+    args = parser.parse_args(argv)
+    if args.command == "compare":
+        compare(args.baseline, args.candidate)
+        return
+
+    report = {"benchmark": args.command, "metadata": _metadata(args), "results": args.func(args)}
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output_path = os.path.join(RESULTS_DIR, f"{args.command}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output_path}")
+
+if __name__ == "__main__":
+    sys.exit(main())
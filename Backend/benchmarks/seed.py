@@ -0,0 +1,63 @@
+import json
+import os
+import random
+import uuid
+from datetime import datetime
+from typing import List, Dict, Any
+
+from benchmarks.fake_omdb import fake_movie
+
+BENCH_PASSWORD = "bench-password"
+
+def synthetic_movies(count: int, seed: int = 42) -> List[Dict[str, Any]]:
+    """Movies in the app's storage format with unique titles"""
+    rng = random.Random(seed)
+    movies = []
+    for n in range(count):
+        omdb = fake_movie(f"Synthetic Movie {n}")
+        movies.append({
+            "title": omdb["Title"],
+            "rating": float(omdb["imdbRating"]),
+            "description": omdb["Plot"],
+            "watched": rng.random() < 0.3,
+            "genre": omdb["Genre"],
+            "year": omdb["Year"],
+            "director": omdb["Director"],
+            "actors": omdb["Actors"],
+            "poster": omdb["Poster"],
+            "notes": "Loved the ending" if rng.random() < 0.2 else None,
+        })
+    return movies
+
+def seed_catalog(data_dir: str, movie_count: int):
+    """Write a guest catalog of movie_count movies"""
+    with open(os.path.join(data_dir, "movies.json"), "w") as f:
+        json.dump(synthetic_movies(movie_count), f, indent=2)
+
+def seed_users(data_dir: str, user_count: int, movies_per_user: int) -> List[str]:
+    """Create benchmark users with identical collections, returns usernames"""
+    from passlib.context import CryptContext
+
+    # Hash once, bcrypt is deliberately slow and every user shares the password
+    hashed_password = CryptContext(schemes=["bcrypt"], deprecated="auto").hash(BENCH_PASSWORD)
+    collection = json.dumps(synthetic_movies(movies_per_user), indent=2)
+
+    users = []
+    movies_dir = os.path.join(data_dir, "user_movies")
+    for n in range(user_count):
+        user_id = str(uuid.uuid4())
+        users.append({
+            "id": user_id,
+            "email": f"bench{n}@example.com",
+            "username": f"bench{n}",
+            "hashed_password": hashed_password,
+            "created_at": datetime.utcnow().isoformat(),
+        })
+        os.makedirs(os.path.join(movies_dir, user_id), exist_ok=True)
+        with open(os.path.join(movies_dir, user_id, "movies.json"), "w") as f:
+            f.write(collection)
+
+    with open(os.path.join(data_dir, "users.json"), "w") as f:
+        json.dump(users, f, indent=2)
+
+    return [user["username"] for user in users]
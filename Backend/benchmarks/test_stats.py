@@ -0,0 +1,17 @@
+from benchmarks.stats import percentile
+
+def test_percentile_nearest_rank():
+    values = [float(i) for i in range(1, 101)]
+    assert percentile(values, 0.50) == 50
+    assert percentile(values, 0.90) == 90
+    assert percentile(values, 0.95) == 95
+    assert percentile(values, 0.99) == 99
+    assert percentile(values, 1.0) == 100
+    assert percentile(values, 0.0) == 1
+    assert percentile(values, 0.07) == 7  # 0.07 * 100 is 7.000000000000001 in floating point
+
+def test_percentile_small_and_empty():
+    assert percentile([], 0.99) == 0.0
+    assert percentile([7.0], 0.5) == 7.0
+    assert percentile([1.0, 2.0, 3.0], 0.5) == 2.0
+    assert percentile([1.0, 2.0, 3.0, 4.0], 0.5) == 2.0
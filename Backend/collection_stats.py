@@ -0,0 +1,182 @@
+import argparse
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List
+
+import journal
+
+try:
+    import fcntl  # Serializes collection changes with their counter updates across workers
+except ImportError:
+    fcntl = None
+
+def _split(value: Any) -> List[str]:
+    """OMDb lists several genres or directors in one comma-separated string"""
+    if not value or value == "N/A":
+        return []
+    return [part.strip() for part in str(value).split(",") if part.strip()]
+
+# Counters kept for every collection, even at zero; bucket counters ("genres/Drama") are dropped at zero
+SCALARS = ("movies", "watched", "rated", "rating_sum", "with_notes")
+BUCKETS = ("genres", "years", "directors")
+BUILT_KEY = "_built"  # Present once the counters were computed from the whole collection
+UPDATED_KEY = "_updated_at"
+
+def _contribution(movie: Dict[str, Any]) -> Dict[str, float]:
+    """Counters one movie adds to its collection's aggregates"""
+    counts = {"movies": 1}
+    if movie.get("watched"):
+        counts["watched"] = 1
+    rating = movie.get("rating") or 0
+    if isinstance(rating, (int, float)) and rating > 0:
+        counts["rated"] = 1
+        counts["rating_sum"] = rating
+    if (movie.get("notes") or "").strip():
+        counts["with_notes"] = 1
+    for bucket, field in (("genres", "genre"), ("years", "year"), ("directors", "director")):
+        for name in _split(movie.get(field)):
+            counts[f"{bucket}/{name}"] = 1
+    return counts
+
+def _deltas(removed: Iterable[Dict[str, Any]], added: Iterable[Dict[str, Any]]) -> Dict[str, float]:
+    deltas: Dict[str, float] = {}
+    for sign, movies in ((-1, removed), (1, added)):
+        for movie in movies:
+            for key, value in _contribution(movie).items():
+                deltas[key] = deltas.get(key, 0) + sign * value
+    return {key: value for key, value in deltas.items() if round(value, 6)}
+
+def compute(movies: Iterable[Dict[str, Any]]) -> Dict[str, float]:
+    """Counters for a whole collection"""
+    counters = dict.fromkeys(SCALARS, 0)
+    for key, value in _deltas((), movies).items():
+        counters[key] = round(counters.get(key, 0) + value, 6)
+    return counters
+
+def _counters(path: str) -> journal.JournaledCollection:
+    # One record per counter, so an update appends only the counters it changes
+    return journal.collection(path, "stats", lambda record: record["key"])
+
+def _as_stats(values: Dict[str, Any]) -> Dict[str, Any]:
+    """Counters shaped as nested aggregates"""
+    stats: Dict[str, Any] = {name: values.get(name, 0) for name in SCALARS}
+    for bucket in BUCKETS:
+        stats[bucket] = {}
+    for key, value in values.items():
+        bucket, _, name = key.partition("/")
+        if name and bucket in stats:
+            stats[bucket][name] = value
+    stats["updated_at"] = values.get(UPDATED_KEY)
+    return stats
+
+@contextmanager
+def lock(path: str):
+    """Hold around a collection change and its apply_changes call
+
+    A first read builds the counters under the same lock, so it can never see
+    a change whose delta is still to be applied and count it twice.
+    """
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".update.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def apply_changes(path: str, removed: Iterable[Dict[str, Any]] = (), added: Iterable[Dict[str, Any]] = ()):
+    """Update the counters the changed movies touch; call with lock(path) held
+
+    An update is the old version removed plus the new version added. Counters
+    that were never built are left alone and built in full on first read.
+    """
+    deltas = _deltas(removed, added)
+    if not deltas:
+        return
+    counters = _counters(path)
+    current = counters.get_many(list(deltas) + [BUILT_KEY])
+    if BUILT_KEY not in current:
+        return
+    values, deleted = [{"key": UPDATED_KEY, "value": time.time()}], []
+    for key, delta in deltas.items():
+        value = round(current.get(key, {}).get("value", 0) + delta, 6)
+        if value > 0 or key in SCALARS:
+            values.append({"key": key, "value": value})
+        else:
+            deleted.append(key)
+    counters.write_many(values, deleted)
+
+def replace(path: str, movies: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Recompute the counters from the whole collection and store them; call with lock(path) held"""
+    values = compute(movies)
+    values[BUILT_KEY] = values[UPDATED_KEY] = time.time()
+    _counters(path).replace_all([{"key": key, "value": value} for key, value in values.items()])
+    return _as_stats(values)
+
+def rebuild(path: str, load_movies: Callable[[], Iterable[Dict[str, Any]]]) -> Dict[str, Any]:
+    """Recompute aggregates from the collection and store them"""
+    with lock(path):
+        return replace(path, load_movies())
+
+def read(path: str, load_movies: Callable[[], Iterable[Dict[str, Any]]]) -> Dict[str, Any]:
+    """Stored aggregates, built from the collection the first time"""
+    values = {record["key"]: record["value"] for record in _counters(path).records()}
+    if BUILT_KEY not in values:
+        with lock(path):
+            values = {record["key"]: record["value"] for record in _counters(path).records()}
+            if BUILT_KEY not in values:
+                return replace(path, load_movies())
+    return _as_stats(values)
+
+def summary(stats: Dict[str, Any], top: int = 10) -> Dict[str, Any]:
+    """Aggregates shaped for the stats endpoints"""
+    movies = stats["movies"]
+
+    def ranked(counts: Dict[str, int]):
+        ordered = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        return [{"name": name, "count": count} for name, count in ordered[:top]]
+
+    return {
+        "movies": movies,
+        "watched": stats["watched"],
+        "unwatched": movies - stats["watched"],
+        "watched_ratio": round(stats["watched"] / movies, 4) if movies else 0.0,
+        "average_rating": round(stats["rating_sum"] / stats["rated"], 2) if stats["rated"] else None,
+        "rated": stats["rated"],
+        "with_notes": stats["with_notes"],
+        "notes_coverage": round(stats["with_notes"] / movies, 4) if movies else 0.0,
+        "genres": ranked(stats["genres"]),
+        "directors": ranked(stats["directors"]),
+        "years": [{"name": year, "count": count} for year, count in sorted(stats["years"].items())],
+        "updated_at": stats.get("updated_at"),
+    }
+
+def main(argv=None):
+    import storage
+    import user_db
+
+    parser = argparse.ArgumentParser(description="Rebuild stored collection statistics from the movie data")
+    parser.add_argument("--user", action="append", default=[], help="Rebuild one user's stats (repeatable)")
+    parser.add_argument("--guest", action="store_true", help="Rebuild the guest catalog rollup")
+    parser.add_argument("--all", action="store_true", help="Rebuild every user and the guest catalog")
+    args = parser.parse_args(argv)
+
+    user_ids = list(args.user)
+    if args.all:
+        user_ids = [user["id"] for user in user_db.load_users()]
+    if not user_ids and not args.guest and not args.all:
+        parser.error("choose --user, --guest or --all")
+
+    for user_id in user_ids:
+        stats = user_db.rebuild_user_stats(user_id)
+        print(f"{user_id}: {stats['movies']} movies")
+    if args.guest or args.all:
+        stats = storage.rebuild_guest_stats()
+        print(f"guest catalog: {stats['movies']} movies")
+
+if __name__ == "__main__":
+    main()
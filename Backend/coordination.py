@@ -0,0 +1,100 @@
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Tuple
+
+from metrics import Counter
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Generation counters live here, one small file per topic
+COORDINATION_DIR = os.environ.get("COORDINATION_DIR", ".state")
+# How often a worker re-reads a generation file; bumps from this worker are seen immediately
+GENERATION_POLL_SECONDS = float(os.environ.get("GENERATION_POLL_SECONDS", "0.25"))
+
+# Topics shared across modules
+INDEX = "index"  # FAISS index and embeddings map
+CATALOG = "catalog"  # Guest catalog in storage.py
+USERS = "users"  # users.json
+POPULAR_SNAPSHOT = "popular_snapshot"
+
+STATE_RELOADS = Counter("coordination_reloads_total", "Cached state reloaded after a generation change", ["topic"])
+
+_SAFE_TOPIC = re.compile(r"[^A-Za-z0-9_.-]")
+_lock = threading.Lock()
+_seen: Dict[str, Tuple[int, float]] = {}  # topic -> (generation, checked_at)
+
+def user_topic(user_id: str) -> str:
+    """Topic for one user's movie directory"""
+    return f"user-{user_id}"
+
+def _path(topic: str) -> str:
+    return os.path.join(COORDINATION_DIR, _SAFE_TOPIC.sub("_", topic) + ".gen")
+
+def _read(topic: str) -> int:
+    try:
+        with open(_path(topic), "r") as f:
+            return int(f.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+def generation(topic: str) -> int:
+    """Current generation of a topic, polled at most every GENERATION_POLL_SECONDS"""
+    now = time.monotonic()
+    seen = _seen.get(topic)
+    if seen is not None and now - seen[1] < GENERATION_POLL_SECONDS:
+        return seen[0]
+    value = _read(topic)
+    with _lock:
+        _seen[topic] = (value, now)
+    return value
+
+def bump(topic: str) -> int:
+    """Record that a topic's data changed on disk; call after the new data is written"""
+    os.makedirs(COORDINATION_DIR, exist_ok=True)
+    path = _path(topic)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        raw = os.read(fd, 64)
+        value = int(raw.strip() or 0) + 1
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.ftruncate(fd, 0)
+        os.write(fd, str(value).encode())
+    finally:
+        os.close(fd)
+    with _lock:
+        _seen[topic] = (value, time.monotonic())
+    return value
+
+class GenerationCache:
+    """Value loaded from disk and reloaded lazily when its topic's generation changes"""
+
+    def __init__(self, topic: str, loader: Callable[[], Any]):
+        self.topic = topic
+        self.loader = loader
+        self._value = None
+        self._generation = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Any:
+        current = generation(self.topic)
+        if self._generation == current:
+            return self._value
+        with self._lock:
+            if self._generation != current:
+                if self._generation is not None:
+                    STATE_RELOADS.inc(topic=self.topic)
+                self._value = self.loader()
+                self._generation = current
+            return self._value
+
+    def invalidate(self):
+        with self._lock:
+            self._generation = None
+            self._value = None
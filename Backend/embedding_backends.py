@@ -0,0 +1,91 @@
+import os
+from typing import List, Union
+
+import numpy as np
+
+# Backend selection: "torch" runs sentence-transformers, "onnx" runs the quantized export
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch").lower()
+ONNX_MODEL_DIR = os.environ.get("ONNX_MODEL_DIR", "onnx_model")
+ONNX_MODEL_FILE = "model_quantized.onnx"
+ONNX_TOKENIZER_FILE = "tokenizer.json"
+MAX_SEQ_LENGTH = 256  # Same truncation as all-MiniLM-L6-v2 in sentence-transformers
+VECTOR_DIMENSION = 384
+
+class TorchBackend:
+    """Full PyTorch model loaded through sentence-transformers"""
+    name = "torch"
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+
+    def encode(self, texts: Union[str, List[str]], show_progress_bar: bool = False,
+               batch_size: int = 32) -> np.ndarray:
+        return self.model.encode(texts, show_progress_bar=show_progress_bar, batch_size=batch_size)
+
+class OnnxBackend:
+    """Int8-quantized export of the model running on ONNX Runtime (CPU)"""
+    name = "onnx"
+
+    def __init__(self, model_dir: str = ONNX_MODEL_DIR):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_path = os.path.join(model_dir, ONNX_MODEL_FILE)
+        tokenizer_path = os.path.join(model_dir, ONNX_TOKENIZER_FILE)
+        if not os.path.exists(model_path) or not os.path.exists(tokenizer_path):
+            raise FileNotFoundError(
+                f"ONNX model not found in {model_dir}. Run export_onnx.py to create it."
+            )
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding()
+
+    def encode(self, texts: Union[str, List[str]], show_progress_bar: bool = False,
+               batch_size: int = 32) -> np.ndarray:
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+        if not texts:
+            return np.zeros((0, VECTOR_DIMENSION), dtype=np.float32)
+
+        # Batch texts of similar length together so padding stays small
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        embeddings = np.zeros((len(texts), VECTOR_DIMENSION), dtype=np.float32)
+        for start in range(0, len(order), batch_size):
+            batch_ids = order[start:start + batch_size]
+            embeddings[batch_ids] = self._encode_batch([texts[i] for i in batch_ids])
+
+        return embeddings[0] if single else embeddings
+
+    def _encode_batch(self, batch: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(batch)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        token_embeddings = self.session.run(None, feeds)[0]
+
+        # Mean pooling over real tokens followed by L2 normalization,
+        # matching the sentence-transformers pipeline for this model
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return (pooled / norms).astype(np.float32)
+
+def load_backend(model_name: str, backend: str = EMBEDDING_BACKEND):
+    """Create the configured embedding backend"""
+    if backend == "onnx":
+        return OnnxBackend()
+    if backend == "torch":
+        return TorchBackend(model_name)
+    raise ValueError(f"Unknown embedding backend: {backend}")
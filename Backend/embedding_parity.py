@@ -0,0 +1,92 @@
+import os
+import sys
+import json
+import time
+from typing import List, Dict, Any
+
+import numpy as np
+
+from embedding_backends import TorchBackend, OnnxBackend
+from vector_search import MODEL_NAME
+
+# Minimum acceptable cosine agreement between the two backends
+MIN_MEAN_COSINE = 0.99
+MIN_WORST_COSINE = 0.97
+
+SAMPLE_QUERIES = [
+    "movie about a boy on a boat with a tiger",
+    "dreams within dreams heist",
+    "astronauts travel through a wormhole",
+    "prison escape with a rock hammer",
+    "mafia family crime drama",
+    "a hacker discovers reality is a simulation",
+]
+
+def load_sample_texts(limit: int = 256) -> List[str]:
+    """Build a parity corpus from the local movie catalog plus sample queries"""
+    texts = list(SAMPLE_QUERIES)
+    if os.path.exists("movies.json"):
+        with open("movies.json", "r") as f:
+            movies = json.load(f)
+        texts.extend(f"{movie['title']} {movie['description']}" for movie in movies)
+    return texts[:limit]
+
+def cosine_agreement(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Row-wise cosine similarity between two embedding matrices"""
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return (a * b).sum(axis=1)
+
+def time_single_queries(backend, queries: List[str], rounds: int = 20) -> Dict[str, float]:
+    """Latency of create_embedding-style single query encoding"""
+    backend.encode(queries[0])  # Warm up
+    timings = []
+    for _ in range(rounds):
+        for query in queries:
+            start = time.perf_counter()
+            backend.encode(query)
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "p50_ms": timings[len(timings) // 2],
+        "p99_ms": timings[min(len(timings) - 1, int(len(timings) * 0.99))],
+        "mean_ms": sum(timings) / len(timings),
+    }
+
+def time_batch(backend, texts: List[str], rounds: int = 3) -> Dict[str, float]:
+    """Throughput of create_embeddings-style batch encoding"""
+    backend.encode(texts[:8])  # Warm up
+    start = time.perf_counter()
+    for _ in range(rounds):
+        backend.encode(texts)
+    elapsed = time.perf_counter() - start
+    return {"texts_per_sec": len(texts) * rounds / elapsed}
+
+def run_comparison() -> Dict[str, Any]:
+    """Compare the ONNX backend against PyTorch for accuracy and speed"""
+    texts = load_sample_texts()
+
+    report: Dict[str, Any] = {"texts": len(texts)}
+    backends = {}
+    for name, factory in (("torch", lambda: TorchBackend(MODEL_NAME)), ("onnx", OnnxBackend)):
+        start = time.perf_counter()
+        backends[name] = factory()
+        report[f"{name}_load_sec"] = time.perf_counter() - start
+
+    torch_embeddings = np.asarray(backends["torch"].encode(texts), dtype=np.float32)
+    onnx_embeddings = np.asarray(backends["onnx"].encode(texts), dtype=np.float32)
+    cosines = cosine_agreement(torch_embeddings, onnx_embeddings)
+    report["cosine_mean"] = float(cosines.mean())
+    report["cosine_min"] = float(cosines.min())
+
+    for name, backend in backends.items():
+        report[f"{name}_create_embedding"] = time_single_queries(backend, SAMPLE_QUERIES)
+        report[f"{name}_create_embeddings"] = time_batch(backend, texts)
+
+    report["passed"] = report["cosine_mean"] >= MIN_MEAN_COSINE and report["cosine_min"] >= MIN_WORST_COSINE
+    return report
+
+if __name__ == "__main__":
+    result = run_comparison()
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if result["passed"] else 1)
@@ -0,0 +1,52 @@
+import os
+from embedding_backends import ONNX_MODEL_DIR, ONNX_MODEL_FILE, MAX_SEQ_LENGTH
+from vector_search import MODEL_NAME
+
+FP32_MODEL_FILE = "model.onnx"
+
+def export_model(output_dir: str = ONNX_MODEL_DIR) -> str:
+    """Export the transformer to ONNX and quantize its weights to int8"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    print(f"Loading {MODEL_NAME} for export...")
+    st_model = SentenceTransformer(MODEL_NAME, device="cpu")
+    transformer = st_model[0].auto_model
+    tokenizer = st_model.tokenizer
+    transformer.eval()
+
+    # Dummy input only fixes the graph signature, batch and sequence stay dynamic
+    dummy = tokenizer(["export sample"], padding=True, truncation=True,
+                      max_length=MAX_SEQ_LENGTH, return_tensors="pt")
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    fp32_path = os.path.join(output_dir, FP32_MODEL_FILE)
+    print(f"Exporting ONNX graph to {fp32_path}")
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            (dummy["input_ids"], dummy["attention_mask"], dummy["token_type_ids"]),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+        )
+
+    quantized_path = os.path.join(output_dir, ONNX_MODEL_FILE)
+    print(f"Quantizing weights to int8: {quantized_path}")
+    quantize_dynamic(fp32_path, quantized_path, weight_type=QuantType.QInt8)
+
+    # Fast tokenizer writes tokenizer.json, which is all the ONNX backend needs
+    tokenizer.save_pretrained(output_dir)
+
+    print("Export complete!")
+    return quantized_path
+
+if __name__ == "__main__":
+    export_model()
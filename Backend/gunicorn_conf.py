@@ -0,0 +1,15 @@
+import multiprocessing
+import os
+
+# Run with: gunicorn -c gunicorn_conf.py main:app
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", str(min(4, multiprocessing.cpu_count()))))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Import the app once in the master before forking so workers share its pages.
+# The search model and index are deliberately not loaded here: torch and faiss
+# start OpenMP thread pools that don't survive fork, and workers that never
+# serve search shouldn't pay for them. Each worker loads them on first search,
+# or right after it starts with WARMUP_MODEL=1. Index, catalog and user changes
+# reach every worker through the generation files in coordination.py.
+preload_app = True
@@ -1,5 +1,4 @@
 import os
-import json
 from typing import List, Dict, Any
 from vector_search import index_movies as create_vector_index
 
@@ -15,9 +14,9 @@ def index_movies(movies: List[Dict[str, Any]]) -> None:
 if __name__ == "__main__":
     # When run as a script, index all movies from the local database
     if os.path.exists("movies.json"):
-        with open("movies.json", "r") as f:
-            movies = json.load(f)
+        from storage import load_movies
         
-        index_movies(movies)
+        # Snapshot plus any journaled changes
+        index_movies(load_movies())
     else:
         print("movies.json file not found. Please add some movies first.")
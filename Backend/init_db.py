@@ -1,5 +1,4 @@
-import json
-import os
+from storage import save_movies
 from omdb_utils import fetch_popular_movies
 from indexer import index_movies
 
@@ -17,8 +16,7 @@ def initialize_database():
         return False
     
     # Save movies to file
-    with open("movies.json", "w") as f:
-        json.dump(movies, f, indent=2)
+    save_movies(movies)
     
     print(f"Added {len(movies)} movies to the database.")
     
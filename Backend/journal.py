@@ -0,0 +1,355 @@
+import os
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from metrics import Counter, STORAGE_LATENCY, STORAGE_BYTES
+import fast_json
+from profiling import span
+
+try:
+    import fcntl  # Keeps compaction from racing appends and reads in other workers
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Append small mutation records instead of rewriting whole collection files
+JOURNAL_ENABLED = os.environ.get("STORAGE_JOURNAL", "1") == "1"
+# Fold the journal into a new snapshot once it grows past this many bytes
+JOURNAL_COMPACT_BYTES = int(os.environ.get("JOURNAL_COMPACT_BYTES", str(1024 * 1024)))
+JOURNAL_MAX_OPEN = int(os.environ.get("JOURNAL_MAX_OPEN", "256"))  # Collections kept in memory
+
+JOURNAL_SUFFIX = ".journal"
+
+JOURNAL_RECORDS = Counter("journal_records_total", "Mutation records appended to collection journals", ["store", "op"])
+JOURNAL_FSYNCS = Counter("journal_fsyncs_total", "fsync calls on collection journals; lower than records when commits group", ["store"])
+JOURNAL_COMPACTIONS = Counter("journal_compactions_total", "Journals folded into a new snapshot", ["store"])
+
+# One compaction at a time, off the request path
+_compact_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="journal-compact")
+
+class JournaledCollection:
+    """List of records stored as a JSON snapshot plus an append-only journal of keyed changes
+
+    Every record is identified by key(record). Journal records are idempotent, so
+    replaying a journal over a snapshot that already contains it gives the same state.
+    """
+
+    def __init__(self, path: str, store: str, key: Callable[[Dict[str, Any]], str]):
+        self.path = path
+        self.journal_path = path + JOURNAL_SUFFIX
+        self.store = store
+        self.key = key
+        self._lock = threading.Lock()  # Guards the in-memory state and the append handle
+        self._sync_lock = threading.Lock()
+        self._items: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._snapshot_id = None  # (inode, mtime) of the snapshot the state was built from
+        self._offset = 0  # Journal bytes already applied to the state
+        self._journal_id = None  # Identity of the journal file those bytes came from
+        self._append_fd = None
+        self._written = 0  # Records written through this handle
+        self._synced = 0  # Records known to be on disk
+        self._compacting = False
+        self._closed = False  # Evicted from the open collections, see collection()
+
+    # Locking across workers
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        if fcntl is None:
+            yield
+            return
+        try:
+            lock_file = open(self.path + ".lock", "a")
+        except FileNotFoundError:
+            # Collection directory not created yet (e.g. a user with no movies), it reads as empty
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            lock_file = open(self.path + ".lock", "a")
+        with lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # Loading
+
+    def _stat_id(self, path: str):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns)
+
+    def _read_snapshot(self):
+        self._items = OrderedDict()
+        if os.path.exists(self.path):
+            with STORAGE_LATENCY.time(store=self.store, operation="read"):
+                with open(self.path, "rb") as f:
+                    data = f.read()
+                records = fast_json.loads(data) if data.strip() else []
+            STORAGE_BYTES.inc(len(data), store=self.store, operation="read")
+            for record in records:
+                key = self.key(record)
+                while key in self._items:
+                    key += "#dup"  # Older files may hold duplicates, keep them all
+                self._items[key] = record
+        self._snapshot_id = self._stat_id(self.path)
+        self._journal_id = None
+        self._offset = 0
+
+    def _read_journal(self):
+        """Apply journal records written since the last read"""
+        try:
+            f = open(self.journal_path, "rb")
+        except FileNotFoundError:
+            self._journal_id = None
+            self._offset = 0
+            return
+        with f:
+            identity = _identity(f.fileno())
+            if self._journal_id is not None and (identity[:2] != self._journal_id[:2] or identity[2] < self._offset):
+                self._read_snapshot()  # Journal was replaced by a compaction
+            self._journal_id = identity
+            f.seek(self._offset)
+            data = f.read()
+        self._apply_journal(data)
+
+    def _apply_journal(self, data: bytes):
+        # A record without its newline is a write in progress or torn by a crash
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                self._apply(fast_json.loads(line))
+            except ValueError:
+                logger.warning("Skipping unreadable journal record", extra={"path": self.journal_path})
+        self._offset += end
+        if end:
+            STORAGE_BYTES.inc(end, store=self.store, operation="journal_read")
+
+    def _apply(self, record: Dict[str, Any]):
+        op = record["op"]
+        if op == "put":
+            old_key, value = record.get("replaces"), record["value"]
+            new_key = self.key(value)
+            if old_key is not None and old_key != new_key and old_key in self._items:
+                # Renamed in place, keep the record's position in the list
+                self._items = OrderedDict(
+                    (new_key, value) if key == old_key else (key, item)
+                    for key, item in self._items.items() if key != new_key
+                )
+            else:
+                self._items[new_key] = value
+        elif op == "delete":
+            self._items.pop(record["key"], None)
+
+    def _refresh(self):
+        """Bring the in-memory state up to date with disk; call with both locks held"""
+        if self._stat_id(self.path) != self._snapshot_id:
+            self._read_snapshot()
+        self._read_journal()
+
+    def load(self) -> List[Dict[str, Any]]:
+        """Current records, as copies the caller may modify"""
+        with span("storage.load", store=self.store), self._file_lock(exclusive=False), self._lock:
+            self._refresh()
+            return [dict(record) for record in self._items.values()]
+
+    def records(self) -> List[Dict[str, Any]]:
+        """Current records without copying, for streaming them out; don't modify them"""
+        with span("storage.load", store=self.store), self._file_lock(exclusive=False), self._lock:
+            self._refresh()
+            return list(self._items.values())
+
+    def get_many(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Copies of the records stored under keys, leaving out keys that have none"""
+        with span("storage.load", store=self.store), self._file_lock(exclusive=False), self._lock:
+            self._refresh()
+            return {key: dict(self._items[key]) for key in keys if key in self._items}
+
+    # Writing
+
+    def _open_for_append(self):
+        if self._append_fd is not None:
+            try:
+                current = os.stat(self.journal_path)
+            except FileNotFoundError:
+                current = None
+            if current is not None and (current.st_ino, current.st_dev) == _identity(self._append_fd)[:2]:
+                return self._append_fd
+            os.close(self._append_fd)  # Compaction replaced the journal
+        self._append_fd = os.open(self.journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        size = os.fstat(self._append_fd).st_size
+        if size:
+            with open(self.journal_path, "rb") as f:
+                f.seek(size - 1)
+                if f.read(1) != b"\n":
+                    os.write(self._append_fd, b"\n")  # Don't glue onto a torn record
+        return self._append_fd
+
+    def _append(self, records: List[Dict[str, Any]]):
+        data = b"".join(fast_json.dumps(record) + b"\n" for record in records)
+        op = records[0]["op"] if len(records) == 1 else "batch"
+        with span("storage.save", store=self.store, op=op), self._file_lock(exclusive=False):
+            with self._lock:
+                self._refresh()
+                with STORAGE_LATENCY.time(store=self.store, operation="append"):
+                    os.write(self._open_for_append(), data)
+                self._written += 1
+                ticket = self._written
+                # Other workers may have appended just before us, read up to and including our records
+                self._read_journal()
+            self._sync(ticket)
+        if self._closed:
+            self.close()  # Evicted while we were writing, don't leak the handle we reopened
+        STORAGE_BYTES.inc(len(data), store=self.store, operation="append")
+        for record in records:
+            JOURNAL_RECORDS.inc(store=self.store, op=record["op"])
+        self._maybe_compact()
+
+    def _sync(self, ticket: int):
+        """Wait until record number ticket is on disk; one fsync covers every writer queued behind it
+
+        The shared file lock held by the caller keeps compaction from replacing
+        the journal meanwhile, and close() syncs before closing the handle, so
+        the handle read under _lock is the file our record went to.
+        """
+        if self._synced >= ticket:
+            return
+        with self._sync_lock:
+            if self._synced >= ticket:
+                return  # Another writer's fsync, or close(), covered ours
+            with self._lock:
+                covered = self._written
+                fd = self._append_fd
+            with STORAGE_LATENCY.time(store=self.store, operation="fsync"):
+                os.fsync(fd)
+            self._synced = covered
+            JOURNAL_FSYNCS.inc(store=self.store)
+
+    def put(self, value: Dict[str, Any], replaces: Optional[str] = None):
+        """Insert or replace a record; replaces is the old key when the record's key changed"""
+        self._commit([{"op": "put", "value": value, "replaces": replaces}])
+
+    def put_many(self, values: List[Dict[str, Any]]):
+        """Insert or replace several records with one write and one fsync"""
+        if values:
+            self._commit([{"op": "put", "value": value, "replaces": None} for value in values])
+
+    def delete(self, key: str):
+        self._commit([{"op": "delete", "key": key}])
+
+    def write_many(self, values: List[Dict[str, Any]], deleted: List[str] = ()):
+        """Insert or replace values and delete keys with one write and one fsync"""
+        records = [{"op": "put", "value": value, "replaces": None} for value in values]
+        records += [{"op": "delete", "key": key} for key in deleted]
+        if records:
+            self._commit(records)
+
+    def _commit(self, records: List[Dict[str, Any]]):
+        if JOURNAL_ENABLED:
+            self._append(records)
+        else:
+            self._rewrite(records)
+
+    def _rewrite(self, records: List[Dict[str, Any]]):
+        """Journal off: apply the changes and rewrite the whole snapshot"""
+        with span("storage.save", store=self.store, op=records[0]["op"]), self._file_lock(exclusive=True), self._lock:
+            self._refresh()
+            for record in records:
+                self._apply(record)
+            self._write_snapshot(list(self._items.values()))
+
+    def replace_all(self, records: List[Dict[str, Any]]):
+        """Write a full snapshot and drop the journal"""
+        with span("storage.save", store=self.store, op="replace_all"), self._file_lock(exclusive=True), self._lock:
+            self._write_snapshot(records)
+
+    # Compaction
+
+    def _write_snapshot(self, records: List[Dict[str, Any]]):
+        """Atomically replace the snapshot and start an empty journal; call with both locks held"""
+        tmp_path = f"{self.path}.tmp.{os.getpid()}"
+        with STORAGE_LATENCY.time(store=self.store, operation="write"):
+            data = fast_json.dumps(records)
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+        STORAGE_BYTES.inc(len(data), store=self.store, operation="write")
+        self._read_snapshot()
+
+    def _maybe_compact(self):
+        try:
+            size = os.path.getsize(self.journal_path)
+        except FileNotFoundError:
+            return
+        if size < JOURNAL_COMPACT_BYTES:
+            return
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+        _compact_pool.submit(self._compact_in_background)
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        except Exception:
+            logger.exception("Journal compaction failed", extra={"path": self.path})
+        finally:
+            with self._lock:
+                self._compacting = False
+
+    def compact(self):
+        """Fold the journal into a new snapshot"""
+        with self._file_lock(exclusive=True), self._lock:
+            self._refresh()
+            if not os.path.exists(self.journal_path):
+                return
+            self._write_snapshot(list(self._items.values()))
+        JOURNAL_COMPACTIONS.inc(store=self.store)
+        logger.info("Compacted journal", extra={"path": self.path, "records": len(self._items)})
+
+    def close(self):
+        """Sync and release the append handle; writers still using the collection reopen it"""
+        self._closed = True
+        with self._sync_lock, self._lock:
+            if self._append_fd is None:
+                return
+            if self._synced < self._written:
+                os.fsync(self._append_fd)
+                self._synced = self._written
+                JOURNAL_FSYNCS.inc(store=self.store)
+            os.close(self._append_fd)
+            self._append_fd = None
+
+def _identity(fd: int):
+    """(inode, device, size) of an open file"""
+    stat = os.fstat(fd)
+    return (stat.st_ino, stat.st_dev, stat.st_size)
+
+# Open collections, least recently used closed first
+_collections: "OrderedDict[str, JournaledCollection]" = OrderedDict()
+_collections_lock = threading.Lock()
+
+def collection(path: str, store: str, key: Callable[[Dict[str, Any]], str]) -> JournaledCollection:
+    """Shared collection object for a snapshot path"""
+    with _collections_lock:
+        found = _collections.get(path)
+        if found is None:
+            found = _collections[path] = JournaledCollection(path, store, key)
+        _collections.move_to_end(path)
+        while len(_collections) > JOURNAL_MAX_OPEN:
+            _, evicted = _collections.popitem(last=False)
+            evicted.close()
+        return found
@@ -1,4 +1,9 @@
-from fastapi import FastAPI, Query, Depends, HTTPException, status
+import startup_timing
+startup_timing.begin()
+
+from fastapi import FastAPI, Query, Depends, HTTPException, Request, status
+from fastapi.responses import Response, StreamingResponse, JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime, timedelta
@@ -6,16 +11,34 @@ from typing import List, Dict, Any, Optional
 import requests
 import json
 import os
-
-from indexer import index_movies
-from vector_search import search_movies, recommend_movies
-from omdb_utils import fetch_movies_by_keyword, fetch_popular_movies, get_movie_details, search_by_description
-from models import Movie, User, UserCreate, Token
+from urllib.parse import urlencode
+import time
+import logging
+import threading
+
+import admission
+import popular_snapshot
+import poster_cache
+from omdb_utils import cache_only, description_cache_key, fetch_movies_by_keyword, fetch_popular_movies, get_movie_details, search_by_description
+from ttl_cache import TTLCache
+from models import Movie, User, UserCreate, Token, BatchSearchRequest
 from auth import (
     authenticate_user, create_access_token, get_current_active_user,
     ACCESS_TOKEN_EXPIRE_MINUTES, create_user
 )
-from storage import load_movies, save_movies, get_user_movies, add_movie, update_movie, delete_movie
+from storage import (
+    load_movies, save_movies, get_user_movies, add_movie, update_movie, delete_movie,
+    export_guest_movies, import_guest_movies, get_guest_stats
+)
+from logging_config import configure_logging
+import fast_json
+import metrics
+import collection_stats
+import ndjson_stream
+import profiling
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Movie Notes API", 
               description="API for managing movie notes with semantic search capabilities")
@@ -29,12 +52,147 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+REQUEST_LATENCY = metrics.Histogram("http_request_duration_seconds", "Request latency by route", ["method", "route"])
+REQUESTS = metrics.Counter("http_requests_total", "Requests by route and status code", ["method", "route", "status"])
+
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    """Profile requests sent with the admin header, plus a sampled fraction of the rest"""
+    reason = profiling.should_profile(request.headers)
+    if reason is None:
+        return await call_next(request)
+
+    profile = profiling.start(request.method, request.url.path, reason)
+    try:
+        response = await call_next(request)
+    finally:
+        profiling.stop(profile)
+    # Joining the sampler and writing the file stay off the event loop
+    await run_in_threadpool(profiling.save, profile, response.status_code)
+    response.headers["X-Profile-Id"] = profile.id
+    return response
+
+@app.middleware("http")
+async def admit_requests(request: Request, call_next):
+    """Cap concurrent slow requests per route; past the queue, degrade or answer 503 straight away"""
+    gate = admission.gate_for(request.url.path)
+    if gate is None:
+        return await call_next(request)
+
+    reason = await gate.acquire()
+    if reason is None:
+        try:
+            return await call_next(request)
+        finally:
+            gate.release()
+
+    admission.ADMISSION_SHED.inc(route=gate.route, reason=reason)
+    if gate.degrade is not None:
+        response = await gate.degrade(request)
+        if response is not None:
+            admission.ADMISSION_DEGRADED.inc(route=gate.route)
+            response.headers["X-Degraded"] = reason
+            return response
+    logger.warning("Request shed", extra={"route": gate.route, "reason": reason})
+    return JSONResponse({"error": "Server is busy, try again shortly"}, status_code=503,
+                        headers={"Retry-After": str(gate.retry_after)})
+
+# Registered last so it is the outermost middleware and also times admission
+# waits, shed 503s and degraded answers
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        # Label by route template so path parameters don't explode cardinality
+        route = request.scope.get("route")
+        route_path = getattr(route, "path", None)
+        if route_path is None:
+            # Shed requests never reach routing; gated paths are fixed templates
+            route_path = request.url.path if admission.gate_for(request.url.path) else "unmatched"
+        REQUEST_LATENCY.observe(time.perf_counter() - start, method=request.method, route=route_path)
+        REQUESTS.inc(method=request.method, route=route_path, status=status_code)
+
+class FastJSONResponse(Response):
+    """JSON encoded straight from stored dicts, skipping validation and jsonable_encoder
+
+    Only for endpoints that return it directly and have no response_model.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return fast_json.dumps(content)
+
 OMDB_API_KEY = "42d83121"  # API key for movie data
 
+# Preload the embedding model in the background once the worker is up
+WARMUP_MODEL = os.environ.get("WARMUP_MODEL", "0") == "1"
+
+# Load the model and index while the app module is imported, for single
+# process runs. Leave it off under gunicorn's preload_app: torch and faiss
+# thread pools created in the master can hang the forked workers
+PRELOAD_SEARCH = os.environ.get("PRELOAD_SEARCH", "0") == "1"
+
+# Results for /recommend/ keyed by the normalized description
+RECOMMEND_CACHE_TTL = float(os.environ.get("RECOMMEND_CACHE_TTL", "600"))
+RECOMMEND_CACHE_STALE_TTL = float(os.environ.get("RECOMMEND_CACHE_STALE_TTL", "3600"))
+RECOMMEND_CACHE_SIZE = int(os.environ.get("RECOMMEND_CACHE_SIZE", "1000"))
+recommend_cache = TTLCache("recommend", RECOMMEND_CACHE_SIZE, RECOMMEND_CACHE_TTL, RECOMMEND_CACHE_STALE_TTL)
+
+# Keep the curated popular movies materialized so fallbacks skip OMDb
+POPULAR_SNAPSHOT = os.environ.get("POPULAR_SNAPSHOT", "1") == "1"
+
+# Heavy search dependencies (faiss, numpy, torch) load on first use
+
+def _vector_search():
+    """Import the vector search module when a search path first needs it"""
+    return startup_timing.lazy_import("vector_search")
+
+def _indexer():
+    """Import the indexer when reindexing is first requested"""
+    return startup_timing.lazy_import("indexer")
+
+def _warmup_model():
+    """Load the embedding model so the first search doesn't pay for it"""
+    try:
+        _vector_search().get_model()
+    except Exception as e:
+        logger.error("Model warmup failed", extra={"error": str(e)})
+
+@app.on_event("startup")
+def on_startup():
+    if WARMUP_MODEL:
+        threading.Thread(target=_warmup_model, name="model-warmup", daemon=True).start()
+    if POPULAR_SNAPSHOT:
+        popular_snapshot.start_refresher()
+
+    report = startup_timing.report()
+    slowest = ", ".join(f"{i['module']}={i['seconds']}s" for i in report["imports"][:5])
+    logger.info(f"Startup took {report['startup_seconds']}s (slowest imports: {slowest})")
+
+@app.get("/startup_report/")
+def startup_report():
+    """Startup and lazy-load timing for this worker"""
+    return startup_timing.report()
+
+@app.get("/admission/")
+def admission_status():
+    """In-flight and queued requests per rate-limited route, for sizing workers"""
+    return admission.status()
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus metrics for this worker"""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 # Movie data fetching
 
 def fetch_movie_details(movie_name: str):
-    print(f"Requesting details for: {movie_name}")
+    logger.info("Requesting details", extra={"movie_name": movie_name})
 
     try:
         data = get_movie_details(movie_name)
@@ -63,7 +221,7 @@ def fetch_movie_details(movie_name: str):
             return {"error": data.get("Error", "Unknown error from OMDb")}
 
     except Exception as e:
-        print(f"Error during OMDb fetch: {e}")
+        logger.error("Error during OMDb fetch", extra={"movie_name": movie_name, "error": str(e)})
         return {"error": str(e)}
 
 # Authentication endpoints
@@ -128,7 +286,7 @@ def add_movie_endpoint(
         return {"error": "Movie not found!"}
 
     except Exception as e:
-        print(f"ERROR in add_movie: {e}")
+        logger.exception("Error in add_movie")
         return {"error": str(e)}
 
 @app.post("/add_movie_guest/")
@@ -151,20 +309,145 @@ def add_movie_guest(movie_name: str):
         return {"error": "Movie not found!"}
 
     except Exception as e:
-        print(f"ERROR in add_movie_guest: {e}")
+        logger.exception("Error in add_movie_guest")
         return {"error": str(e)}
 
-@app.get("/movies/", response_model=List[Dict[str, Any]])
-def get_movies_endpoint(current_user: User = Depends(get_current_active_user)):
+def _with_thumbnails(movies: List[Dict[str, Any]], request: Request) -> List[Dict[str, Any]]:
+    """Add a poster_thumb URL pointing at the local poster proxy"""
+    base = str(request.url_for("poster_endpoint"))
+    return [
+        dict(movie, poster_thumb=f"{base}?{urlencode({'url': movie['poster'], 'size': 'thumb'})}")
+        if movie.get("poster") else movie
+        for movie in movies
+    ]
+
+# Listings can run to thousands of movies, so they skip response_model validation
+@app.get("/movies/", response_class=FastJSONResponse)
+def get_movies_endpoint(request: Request,
+                        thumbnails: bool = Query(False, description="Add poster_thumb URLs served by /poster/"),
+                        current_user: User = Depends(get_current_active_user)):
     """Retrieve user's movie collection"""
     from user_db import get_user_movies
-    return get_user_movies(current_user.id)
+    movies = get_user_movies(current_user.id)
+    return FastJSONResponse(_with_thumbnails(movies, request) if thumbnails else movies)
 
-@app.get("/movies_guest/", response_model=List[Dict[str, Any]])
-def get_movies_guest():
+@app.get("/movies_guest/", response_class=FastJSONResponse)
+def get_movies_guest(request: Request,
+                     thumbnails: bool = Query(False, description="Add poster_thumb URLs served by /poster/")):
     """Get movies for non-logged in users"""
     all_movies = load_movies()
-    return [movie for movie in all_movies if not movie.get("user_id")]
+    movies = [movie for movie in all_movies if not movie.get("user_id")]
+    return FastJSONResponse(_with_thumbnails(movies, request) if thumbnails else movies)
+
+@app.get("/poster/")
+def poster_endpoint(request: Request,
+                    url: str = Query(..., description="Poster URL from a movie record"),
+                    size: str = Query("thumb", regex="^(thumb|full)$")):
+    """Poster image from the local cache, fetched from upstream only the first time"""
+    try:
+        poster = poster_cache.get_poster(url, thumbnail=size == "thumb")
+    except poster_cache.PosterError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    
+    # A poster URL always names the same image, so browsers may keep it for good
+    headers = {"Cache-Control": "public, max-age=31536000, immutable", "ETag": f'"{poster.etag}"'}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=poster.data, media_type=poster.media_type, headers=headers)
+
+# Backups: NDJSON, one movie per line, optionally gzipped
+
+def _ndjson_download(records, name: str, gzip: bool) -> StreamingResponse:
+    filename = f"{name}.ndjson.gz" if gzip else f"{name}.ndjson"
+    return StreamingResponse(
+        ndjson_stream.encode(records, gzip),
+        media_type="application/gzip" if gzip else ndjson_stream.NDJSON_MEDIA_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+# Fields of an imported movie and the defaults add_movie gives them; anything else is dropped
+IMPORT_TEXT_FIELDS = {
+    "description": "No description available.",
+    "genre": "",
+    "year": "",
+    "director": "",
+    "actors": "",
+    "poster": "",
+    "imdb_id": "",
+}
+
+def _import_problem(record) -> Optional[str]:
+    """Why an imported line can't be stored as a movie, or None after shaping it like an added movie"""
+    if not isinstance(record, dict):
+        return "expected a JSON object"
+    if not isinstance(record.get("title"), str) or not record["title"].strip():
+        return "missing title"
+    rating = record.get("rating", 0.0)
+    if isinstance(rating, bool) or not isinstance(rating, (int, float)):
+        return "rating must be a number"
+    if not isinstance(record.get("watched", False), bool):
+        return "watched must be true or false"
+    if not isinstance(record.get("notes"), (str, type(None))):
+        return "notes must be a string"
+
+    movie = {"title": record["title"], "rating": float(rating), "watched": record.get("watched", False),
+             "notes": record.get("notes")}
+    for field, default in IMPORT_TEXT_FIELDS.items():
+        value = record.get(field)
+        if value is None:
+            value = default
+        elif not isinstance(value, str):
+            return f"{field} must be a string"
+        movie[field] = value
+    # The batch keeps this same object, so reshape it in place
+    record.clear()
+    record.update(movie)
+    return None
+
+async def _import_ndjson(request: Request, upsert):
+    """Read the body batch by batch; batches before a failure stay imported"""
+    report = ndjson_stream.ImportReport()
+    async for batch in ndjson_stream.decode_batches(request.stream(), report, _import_problem):
+        report.imported += await run_in_threadpool(upsert, batch)
+    if report.aborted:
+        # The counts say how much of the body made it in before the bad data
+        return JSONResponse(report.as_dict(), status_code=400)
+    return report.as_dict()
+
+@app.get("/export_movies/")
+def export_movies_endpoint(gzip: bool = Query(False, description="Gzip the download"),
+                           current_user: User = Depends(get_current_active_user)):
+    """Download the user's collection as NDJSON"""
+    from user_db import export_user_movies
+    return _ndjson_download(export_user_movies(current_user.id), "movies", gzip)
+
+@app.post("/import_movies/")
+async def import_movies_endpoint(request: Request, current_user: User = Depends(get_current_active_user)):
+    """Add or replace movies in the user's collection from an NDJSON (or gzipped NDJSON) body"""
+    from user_db import import_user_movies
+    return await _import_ndjson(request, lambda batch: import_user_movies(current_user.id, batch))
+
+@app.get("/export_movies_guest/")
+def export_movies_guest(gzip: bool = Query(False, description="Gzip the download")):
+    """Download the guest catalog as NDJSON"""
+    return _ndjson_download(export_guest_movies(), "movies_guest", gzip)
+
+@app.post("/import_movies_guest/")
+async def import_movies_guest(request: Request):
+    """Add or replace guest movies from an NDJSON (or gzipped NDJSON) body"""
+    return await _import_ndjson(request, import_guest_movies)
+
+@app.get("/stats/")
+def stats_endpoint(top: int = Query(10, ge=1, le=100, description="Entries per distribution"),
+                   current_user: User = Depends(get_current_active_user)):
+    """Watched counts, ratings, notes coverage and genre/year/director breakdowns for the user"""
+    from user_db import get_user_stats
+    return collection_stats.summary(get_user_stats(current_user.id), top)
+
+@app.get("/stats_guest/")
+def stats_guest(top: int = Query(10, ge=1, le=100, description="Entries per distribution")):
+    """The same statistics for the guest catalog"""
+    return collection_stats.summary(get_guest_stats(), top)
 
 @app.put("/mark_watched/")
 def mark_watched_endpoint(
@@ -219,6 +502,16 @@ def update_movie_notes_guest(movie_name: str, notes: str):
         
     return {"message": "Notes updated successfully", "movie": result}
 
+@app.get("/search_notes/")
+def search_notes_endpoint(
+    q: str = Query(..., description='Words, prefix* terms or "quoted phrases"'),
+    limit: int = Query(20, description="Maximum number of movies to return"),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Search the current user's notes, titles and genres"""
+    from notes_index import search_notes
+    return {"results": search_notes(current_user.id, q, limit)}
+
 @app.delete("/delete_movie/")
 def delete_movie_endpoint(
     movie_name: str,
@@ -257,25 +550,48 @@ def toggle_details(movie_name: str):
 @app.post("/reindex/")
 def reindex_movies():
     movies = load_movies()
-    index_movies(movies)
+    _indexer().index_movies(movies)
     return {"message": "Reindexing complete!"}
 
 @app.get("/search/")
 def search_movie(query: str):
     """Search for a movie by title or keywords"""
-    results = search_movies(query)
+    results = _vector_search().search_movies(query)
     if results:
         return {"result": results[0]}
     return {"error": "No match found"}
 
+@app.post("/search_batch/")
+def search_batch(request: BatchSearchRequest):
+    """Semantic search for many queries at once, encoded and searched as one batch"""
+    results = _vector_search().search_movies_batch(request.queries, request.top_k)
+    return FastJSONResponse({
+        "results": [{"query": query, "results": matches} for query, matches in zip(request.queries, results)]
+    })
+
+@app.get("/similar/")
+def similar(title: str = Query(..., description="Title of an indexed movie"),
+            top_k: int = Query(5, ge=1, le=50, description="Number of similar movies to return")):
+    """Movies closest to one already in the index, served from the precomputed neighbour graph"""
+    results = _vector_search().similar_movies(title, top_k)
+    if results is None:
+        return {"error": f"'{title}' is not in the search index"}
+    return {"movie": title, "similar": results}
+
 @app.get("/recommend/")
 def recommend(query: str = Query(..., description="Vague movie description or idea"), 
               top_k: int = Query(5, description="Number of recommendations to return")):
     """Find movies based on a description or theme"""
-    print(f"Searching external APIs for: {query}")
+    logger.info("Searching external APIs", extra={"query": query})
     
-    external_results = search_by_description(query, count=top_k)
-    print(f"Found: {[r['title'] for r in external_results] if external_results else 'None'}")
+    # Descriptions that differ only in stop words or punctuation share one cached result list
+    cache_key = (description_cache_key(query), top_k)
+    external_results = recommend_cache.get_or_compute(
+        cache_key,
+        lambda: search_by_description(query, count=top_k),
+        should_cache=bool,  # Don't pin an empty answer from an upstream outage
+    )
+    logger.info("External search finished", extra={"query": query, "found": [r['title'] for r in external_results]})
     
     if external_results:
         # Return the external results directly without saving to database
@@ -309,6 +625,49 @@ def fetch_movies(keyword: str = Query(None, description="Keyword to search for m
         "message": "No movies found."
     }
 
+@admission.degraded("/recommend/")
+async def recommend_degraded(request: Request) -> Optional[Response]:
+    """Cached results for the description, else the popular snapshot, without calling OMDb"""
+    query = request.query_params.get("query")
+    if not query:
+        return None
+    try:
+        top_k = int(request.query_params.get("top_k", 5))
+    except ValueError:
+        return None
+    cached = recommend_cache.peek((description_cache_key(query), top_k))
+    if cached:
+        return JSONResponse({"recommendations": cached, "degraded": True,
+                             "message": f"Found {len(cached)} movies matching your description (cached)"})
+    popular = popular_snapshot.popular_movies()
+    if popular:
+        return JSONResponse({"recommendations": popular[:top_k], "degraded": True,
+                             "message": "Busy right now, showing popular movies instead"})
+    return None
+
+@admission.degraded("/fetch_movies/")
+async def fetch_movies_degraded(request: Request) -> Optional[Response]:
+    """The same search answered from recorded OMDb responses only"""
+    try:
+        count = int(request.query_params.get("count", 10))
+    except ValueError:
+        return None
+
+    def from_cache():
+        with cache_only():
+            return fetch_movies(keyword=request.query_params.get("keyword"), count=count)
+
+    result = await run_in_threadpool(from_cache)
+    if not result["movies"]:
+        return None
+    return JSONResponse({**result, "degraded": True})
+
+if PRELOAD_SEARCH:
+    _vector_search().get_model()
+    _vector_search().get_index()
+
+startup_timing.end()
+
 # Start server when run directly
 if __name__ == "__main__":
     import uvicorn
@@ -38,3 +38,7 @@ class Movie(BaseModel):
     poster: str = ""
     notes: Optional[str] = None  # User's personal notes
     user_id: Optional[str] = None  # Owner of this movie entry
+
+class BatchSearchRequest(BaseModel):
+    queries: List[str] = Field(..., min_items=1, max_items=256)  # One embedding batch per request
+    top_k: int = Field(5, ge=1, le=50)
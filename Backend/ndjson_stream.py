@@ -0,0 +1,131 @@
+import zlib
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional
+
+import fast_json
+
+CHUNK_BYTES = 64 * 1024  # Bytes gathered before each chunk is sent, and decompressed per step
+IMPORT_BATCH_SIZE = 500  # Records upserted per write while importing
+MAX_LINE_BYTES = 1024 * 1024  # Longest record accepted on import
+MAX_REPORTED_ERRORS = 20
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+GZIP_MAGIC = b"\x1f\x8b"
+
+def encode(records: Iterable[Dict[str, Any]], gzip: bool = False) -> Iterator[bytes]:
+    """One JSON object per line, in chunks of about CHUNK_BYTES, optionally gzipped"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+    pending: List[bytes] = []
+    size = 0
+    for record in records:
+        line = fast_json.dumps(record) + b"\n"
+        pending.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            chunk = b"".join(pending)
+            pending, size = [], 0
+            chunk = compressor.compress(chunk) if compressor else chunk
+            if chunk:
+                yield chunk
+    chunk = b"".join(pending)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+class ImportReport:
+    """Counts and the first few problems from one import"""
+
+    def __init__(self):
+        self.lines = 0
+        self.imported = 0
+        self.errors: List[str] = []
+        self.error_count = 0
+        self.aborted: Optional[str] = None  # Why the rest of the body couldn't be read
+
+    def error(self, message: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"line {self.lines}: {message}")
+
+    def as_dict(self) -> Dict[str, Any]:
+        result = {"lines": self.lines, "imported": self.imported, "skipped": self.error_count, "errors": self.errors}
+        if self.aborted:
+            result["aborted"] = self.aborted
+        return result
+
+async def _decompressed(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Body bytes, gunzipped if the body starts with the gzip magic number"""
+    decompressor = None
+    first = True
+    async for chunk in chunks:
+        if first and chunk:
+            first = False
+            if chunk[:2] == GZIP_MAGIC:
+                decompressor = zlib.decompressobj(31)
+        if decompressor is None:
+            yield chunk
+            continue
+        # Inflate in bounded steps so a small upload can't expand all at once
+        data = decompressor.decompress(chunk, CHUNK_BYTES)
+        while data:
+            yield data
+            data = decompressor.decompress(decompressor.unconsumed_tail, CHUNK_BYTES)
+    if decompressor is not None:
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+        if not decompressor.eof:
+            raise zlib.error("body ended before the end of the gzip stream")
+
+async def decode_batches(chunks: AsyncIterator[bytes], report: ImportReport,
+                         validate: Callable[[Any], Optional[str]],
+                         batch_size: int = IMPORT_BATCH_SIZE) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Valid records from an NDJSON body in batches; bad lines are counted in report and skipped"""
+    batch: List[Dict[str, Any]] = []
+    buffer = b""
+    skipping = False  # Inside a line that is already too long
+
+    def take(line: bytes):
+        report.lines += 1
+        if not line.strip():
+            return
+        if len(line) > MAX_LINE_BYTES:
+            report.error(f"record longer than {MAX_LINE_BYTES} bytes")
+            return
+        try:
+            record = fast_json.loads(line)
+        except ValueError:
+            report.error("not valid JSON")
+            return
+        problem = validate(record)
+        if problem:
+            report.error(problem)
+            return
+        batch.append(record)
+
+    try:
+        async for data in _decompressed(chunks):
+            lines = (buffer + data).split(b"\n")
+            buffer = lines.pop()  # Unfinished last line
+            for line in lines:
+                if skipping:
+                    skipping = False
+                    continue
+                take(line)
+            if skipping:
+                buffer = b""  # Still inside the over-long line
+            elif len(buffer) > MAX_LINE_BYTES:
+                report.lines += 1
+                report.error(f"record longer than {MAX_LINE_BYTES} bytes")
+                buffer, skipping = b"", True
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    except zlib.error as e:
+        # Corrupt or truncated gzip: keep the complete lines before it, drop the cut-off one
+        report.aborted = f"gzip data is corrupt or truncated: {e}"
+        buffer = b""
+    if buffer and not skipping:
+        take(buffer)
+    if batch:
+        yield batch
@@ -0,0 +1,223 @@
+import bisect
+import html
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+import coordination
+from metrics import cache_hit, cache_miss
+
+# Searchable fields and how much a match in each counts
+FIELD_WEIGHTS = {"title": 3.0, "genre": 2.0, "notes": 1.0}
+SNIPPET_WORDS = 12  # Words of context around the first match
+NOTES_INDEX_MAX_USERS = int(os.environ.get("NOTES_INDEX_MAX_USERS", "256"))
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+_QUERY_PART = re.compile(r'"([^"]*)"|(\S+)')
+
+def _tokenize(text: str) -> List[Tuple[str, int, int]]:
+    """(term, start, end) for every word in text"""
+    return [(m.group().lower(), m.start(), m.end()) for m in _TOKEN.finditer(text or "")]
+
+def _doc_key(title: str) -> str:
+    return title.lower()
+
+class NotesIndex:
+    """Inverted index over one user's notes, titles and genres"""
+
+    def __init__(self):
+        self.docs: Dict[str, Dict[str, Any]] = {}  # doc key -> title and per-field text/tokens
+        self.postings: Dict[str, Dict[str, Dict[str, List[int]]]] = {}  # term -> doc key -> field -> positions
+        self.vocabulary: List[str] = []  # Sorted terms for prefix lookups
+
+    def add(self, movie: Dict[str, Any]):
+        """Index a movie, replacing any earlier version with the same title"""
+        key = _doc_key(movie["title"])
+        self.remove(movie["title"])
+
+        fields = {}
+        for field in FIELD_WEIGHTS:
+            text = movie.get(field) or ""
+            tokens = _tokenize(text)
+            fields[field] = {"text": text, "tokens": tokens}
+            for position, (term, _, _) in enumerate(tokens):
+                docs = self.postings.get(term)
+                if docs is None:
+                    docs = self.postings[term] = {}
+                    bisect.insort(self.vocabulary, term)
+                docs.setdefault(key, {}).setdefault(field, []).append(position)
+
+        self.docs[key] = {"title": movie["title"], "fields": fields}
+
+    def remove(self, title: str):
+        key = _doc_key(title)
+        doc = self.docs.pop(key, None)
+        if doc is None:
+            return
+        for field in doc["fields"].values():
+            for term, _, _ in field["tokens"]:
+                docs = self.postings.get(term)
+                if docs is None or docs.pop(key, None) is None:
+                    continue
+                if not docs:
+                    del self.postings[term]
+                    del self.vocabulary[bisect.bisect_left(self.vocabulary, term)]
+
+    def _expand_prefix(self, prefix: str) -> List[str]:
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        end = bisect.bisect_left(self.vocabulary, prefix + "\uffff")
+        return self.vocabulary[start:end]
+
+    def _term_matches(self, terms: List[str]) -> Dict[str, Dict[str, List[int]]]:
+        """doc key -> field -> positions for any of the given terms"""
+        matches: Dict[str, Dict[str, List[int]]] = {}
+        for term in terms:
+            for key, fields in self.postings.get(term, {}).items():
+                doc_fields = matches.setdefault(key, {})
+                for field, positions in fields.items():
+                    doc_fields.setdefault(field, []).extend(positions)
+        return matches
+
+    def _phrase_matches(self, words: List[str]) -> Dict[str, Dict[str, List[int]]]:
+        """doc key -> field -> positions of every word in each consecutive occurrence"""
+        if not words or any(word not in self.postings for word in words):
+            return {}
+        first = self.postings[words[0]]
+        matches: Dict[str, Dict[str, List[int]]] = {}
+        for key in first:
+            if not all(key in self.postings[word] for word in words[1:]):
+                continue
+            for field, starts in first[key].items():
+                following = [set(self.postings[word][key].get(field, ())) for word in words[1:]]
+                for start in starts:
+                    if all(start + offset + 1 in positions for offset, positions in enumerate(following)):
+                        matches.setdefault(key, {}).setdefault(field, []).extend(range(start, start + len(words)))
+        return matches
+
+    def search(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Find movies matching every word, prefix* term and quoted phrase in the query"""
+        clauses = []
+        for phrase, word in _QUERY_PART.findall(query):
+            if phrase:
+                words = [term for term, _, _ in _tokenize(phrase)]
+                if words:
+                    clauses.append(self._phrase_matches(words))
+            elif word.endswith("*") and len(word) > 1:
+                for term, _, _ in _tokenize(word[:-1]):
+                    clauses.append(self._term_matches(self._expand_prefix(term)))
+            else:
+                for term, _, _ in _tokenize(word):
+                    clauses.append(self._term_matches([term]))
+        if not clauses:
+            return []
+
+        keys = set(clauses[0])
+        for clause in clauses[1:]:
+            keys &= clause.keys()
+
+        results = []
+        for key in keys:
+            hits: Dict[str, set] = {}
+            for clause in clauses:
+                for field, positions in clause[key].items():
+                    hits.setdefault(field, set()).update(positions)
+            score = sum(FIELD_WEIGHTS[field] * len(positions) for field, positions in hits.items())
+            doc = self.docs[key]
+            snippet_field = "notes" if "notes" in hits else next(iter(hits))
+            results.append({
+                "title": doc["title"],
+                "score": score,
+                "matched_fields": sorted(hits),
+                "snippet": _snippet(doc["fields"][snippet_field], hits[snippet_field]),
+            })
+
+        results.sort(key=lambda result: (-result["score"], result["title"].lower()))
+        return results[:limit]
+
+def _snippet(field: Dict[str, Any], positions: set) -> str:
+    """Text around the first match with matched words wrapped in <mark>"""
+    text, tokens = field["text"], field["tokens"]
+    first = min(positions)
+    start = max(0, first - SNIPPET_WORDS // 2)
+    end = min(len(tokens), start + SNIPPET_WORDS)
+
+    parts = ["…" if start > 0 else ""]
+    cursor = tokens[start][1]
+    for position in range(start, end):
+        _, token_start, token_end = tokens[position]
+        parts.append(html.escape(text[cursor:token_start]))
+        word = html.escape(text[token_start:token_end])
+        parts.append(f"<mark>{word}</mark>" if position in positions else word)
+        cursor = token_end
+    if end < len(tokens):
+        parts.append("…")
+    return "".join(parts)
+
+# Per-user indexes, least recently used evicted first
+_indexes: "OrderedDict[str, Tuple[int, NotesIndex]]" = OrderedDict()
+_lock = threading.Lock()
+
+def _build(user_id: str) -> NotesIndex:
+    from user_db import get_user_movies
+
+    index = NotesIndex()
+    for movie in get_user_movies(user_id):
+        index.add(movie)
+    return index
+
+def get_index(user_id: str) -> NotesIndex:
+    """User's index, rebuilt if another worker changed their collection"""
+    current = coordination.generation(coordination.user_topic(user_id))
+    with _lock:
+        entry = _indexes.get(user_id)
+        if entry is not None and entry[0] == current:
+            _indexes.move_to_end(user_id)
+            cache_hit("notes_index")
+            return entry[1]
+
+    cache_miss("notes_index")
+    index = _build(user_id)
+    with _lock:
+        _indexes[user_id] = (current, index)
+        _indexes.move_to_end(user_id)
+        while len(_indexes) > NOTES_INDEX_MAX_USERS:
+            _indexes.popitem(last=False)
+    return index
+
+def _apply(user_id: str, generation: int, change):
+    """Apply an incremental change to a loaded index after the collection was saved
+
+    generation is what coordination.bump returned for this change. The index
+    only moves forward if it was exactly one generation behind; otherwise some
+    other change (maybe another worker's) is missing, so it is dropped and the
+    next search rebuilds it from disk.
+    """
+    with _lock:
+        entry = _indexes.get(user_id)
+        if entry is None:
+            return  # Not loaded, the next search builds it from disk
+        if entry[0] != generation - 1:
+            del _indexes[user_id]
+            return
+        change(entry[1])
+        _indexes[user_id] = (generation, entry[1])
+
+def movie_saved(user_id: str, generation: int, movie: Dict[str, Any], previous_title: Optional[str] = None):
+    """Keep the index in step with add_user_movie/update_user_movie"""
+    def change(index: NotesIndex):
+        if previous_title and _doc_key(previous_title) != _doc_key(movie["title"]):
+            index.remove(previous_title)
+        index.add(movie)
+    _apply(user_id, generation, change)
+
+def movie_deleted(user_id: str, generation: int, title: str):
+    """Keep the index in step with delete_user_movie"""
+    _apply(user_id, generation, lambda index: index.remove(title))
+
+def search_notes(user_id: str, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+    """Search a user's notes, titles and genres"""
+    index = get_index(user_id)
+    with _lock:
+        return index.search(query, limit)
@@ -0,0 +1,198 @@
+import contextvars
+import functools
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from typing import Dict, Any, Tuple
+
+from metrics import Counter, Gauge
+
+try:
+    import fcntl  # Shares the bucket across uvicorn workers on POSIX
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Request priorities, lower value is served first
+INTERACTIVE = 0  # A user is waiting on this lookup (/add_movie/)
+RECOMMEND = 1  # Filling in recommendation results
+BACKGROUND = 2  # Warmups and snapshot refreshes
+PRIORITY_NAMES = {INTERACTIVE: "interactive", RECOMMEND: "recommend", BACKGROUND: "background"}
+
+# Budget configuration
+OMDB_RATE_PER_SEC = float(os.environ.get("OMDB_RATE_PER_SEC", "10"))
+OMDB_BURST = float(os.environ.get("OMDB_BURST", "20"))
+OMDB_DAILY_QUOTA = int(os.environ.get("OMDB_DAILY_QUOTA", "1000"))  # Free OMDb keys allow 1,000 a day
+OMDB_SCHEDULER_FILE = os.environ.get("OMDB_SCHEDULER_FILE", "omdb_quota.json")
+
+# Share of the daily quota kept back from each priority; below it the call is served cache-only
+QUOTA_RESERVE = {INTERACTIVE: 0.0, RECOMMEND: 0.10, BACKGROUND: 0.30}
+
+# How long each priority may queue for a token before degrading to cache-only
+MAX_WAIT_SECONDS = {INTERACTIVE: 5.0, RECOMMEND: 2.0, BACKGROUND: 30.0}
+
+SCHEDULER_DECISIONS = Counter("omdb_scheduler_decisions_total", "Token bucket decisions by priority", ["priority", "decision"])
+
+_current_priority = contextvars.ContextVar("omdb_priority", default=INTERACTIVE)
+
+@contextmanager
+def omdb_priority(priority: int):
+    """Run OMDb calls in this block at the given priority"""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+def current_priority() -> int:
+    return _current_priority.get()
+
+def lowered_priority(priority: int):
+    """Decorator running a function at this priority or lower, never higher than its caller"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with omdb_priority(max(priority, current_priority())):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class OmdbScheduler:
+    """Token bucket plus daily quota, stored in a locked file so every worker draws from one budget"""
+
+    def __init__(self, path: str = OMDB_SCHEDULER_FILE, rate: float = OMDB_RATE_PER_SEC,
+                 burst: float = OMDB_BURST, daily_quota: int = OMDB_DAILY_QUOTA):
+        self.path = path
+        self.rate = rate
+        self.burst = burst
+        self.daily_quota = daily_quota
+        self._cond = threading.Condition()
+        self._queue = []  # (priority, sequence) tickets waiting in this process
+        self._sequence = itertools.count()
+        self._local_state = None  # Used when fcntl is unavailable
+
+    @staticmethod
+    def _today() -> str:
+        return time.strftime("%Y-%m-%d", time.gmtime())
+
+    def _fresh_state(self) -> Dict[str, Any]:
+        return {"tokens": self.burst, "updated": time.time(), "day": self._today(), "used": 0}
+
+    def _update_state(self, change):
+        """Apply change(state) to the shared state under an exclusive file lock"""
+        if fcntl is None:
+            if self._local_state is None:
+                self._local_state = self._fresh_state()
+            return change(self._local_state)
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            raw = os.read(fd, 4096)
+            try:
+                state = json.loads(raw) if raw else self._fresh_state()
+            except ValueError:
+                state = self._fresh_state()
+            result = change(state)
+            data = json.dumps(state).encode()
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.ftruncate(fd, 0)
+            os.write(fd, data)
+            return result
+        finally:
+            os.close(fd)  # Closing releases the lock
+
+    def _refill(self, state: Dict[str, Any]):
+        now = time.time()
+        state["tokens"] = min(self.burst, state["tokens"] + (now - state["updated"]) * self.rate)
+        state["updated"] = now
+        today = self._today()
+        if state["day"] != today:
+            state["day"] = today
+            state["used"] = 0
+
+    def _try_take(self, priority: int) -> Tuple[str, float]:
+        """Returns ("granted", 0), ("wait", seconds) or ("degrade", 0)"""
+        def change(state):
+            self._refill(state)
+            reserve = self.daily_quota * QUOTA_RESERVE[priority]
+            if self.daily_quota - state["used"] <= reserve:
+                return "degrade", 0.0
+            if state["tokens"] >= 1:
+                state["tokens"] -= 1
+                state["used"] += 1
+                return "granted", 0.0
+            return "wait", (1 - state["tokens"]) / self.rate
+
+        return self._update_state(change)
+
+    def acquire(self, priority: int = None) -> bool:
+        """Wait for a token in priority order; False means serve this call from cache only"""
+        if priority is None:
+            priority = current_priority()
+        priority_name = PRIORITY_NAMES.get(priority, str(priority))
+        deadline = time.monotonic() + MAX_WAIT_SECONDS.get(priority, 5.0)
+        ticket = (priority, next(self._sequence))
+        waited = False
+
+        with self._cond:
+            heapq.heappush(self._queue, ticket)
+            try:
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if self._queue[0] == ticket:
+                        decision, wait = self._try_take(priority)
+                        if decision == "granted":
+                            SCHEDULER_DECISIONS.inc(priority=priority_name, decision="waited" if waited else "granted")
+                            return True
+                        if decision == "degrade" or wait > remaining:
+                            SCHEDULER_DECISIONS.inc(priority=priority_name, decision="degraded")
+                            return False
+                    elif remaining <= 0:
+                        SCHEDULER_DECISIONS.inc(priority=priority_name, decision="degraded")
+                        return False
+                    else:
+                        wait = remaining
+                    waited = True
+                    self._cond.wait(min(wait, remaining))
+            finally:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+
+    def mark_exhausted(self):
+        """OMDb said the daily limit is reached, stop spending until tomorrow"""
+        def change(state):
+            self._refill(state)
+            state["used"] = max(state["used"], self.daily_quota)
+
+        self._update_state(change)
+        logger.warning("OMDb daily limit reached, degrading to cache-only")
+
+    def status(self) -> Dict[str, Any]:
+        """Current tokens and daily usage"""
+        def change(state):
+            self._refill(state)
+            return dict(state)
+
+        state = self._update_state(change)
+        return {
+            "tokens": round(state["tokens"], 2),
+            "used_today": state["used"],
+            "daily_quota": self.daily_quota,
+            "remaining_today": max(0, self.daily_quota - state["used"]),
+            "queued_in_process": len(self._queue),
+        }
+
+scheduler = OmdbScheduler()
+
+def _quota_remaining():
+    return {(): scheduler.status()["remaining_today"]}
+
+QUOTA_REMAINING = Gauge("omdb_quota_remaining", "OMDb calls left in today's quota", callback=_quota_remaining)
@@ -0,0 +1,142 @@
+import json
+import os
+import threading
+import time
+import logging
+from typing import Dict, Any, Optional
+
+import requests
+
+from metrics import Counter, cache_hit, cache_miss
+
+logger = logging.getLogger(__name__)
+
+# live: always call OMDb; record: call OMDb and keep responses; replay: cassette only, no network
+OMDB_TRANSPORT_MODE = os.environ.get("OMDB_TRANSPORT_MODE", "live").lower()
+OMDB_CASSETTE_FILE = os.environ.get("OMDB_CASSETTE_FILE", "omdb_cassette.jsonl")
+TRANSPORT_MODES = ("live", "record", "replay")
+
+# Upstream answers that say nothing about the movie and must not be recorded
+_TRANSIENT_ERRORS = ("request limit", "invalid api key", "no api key")
+
+TRANSPORT_RESPONSES = Counter("omdb_transport_responses_total", "OMDb responses by transport mode and source", ["mode", "source"])
+
+OFFLINE_MISS = {"Response": "False", "Error": "Not available offline"}
+
+def cassette_key(params: Dict[str, Any]) -> str:
+    """Canonical key for an OMDb query, ignoring the API key and case/spacing of titles"""
+    canonical = {}
+    for name, value in params.items():
+        if name == "apikey" or value is None:
+            continue
+        value = str(value)
+        if name in ("t", "s"):
+            value = " ".join(value.lower().split())
+        canonical[name] = value
+    return json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+
+class CassetteStore:
+    """Append-only JSON-lines file of recorded OMDb responses, indexed in memory"""
+
+    def __init__(self, path: str = OMDB_CASSETTE_FILE):
+        self.path = path
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self._entries is None:
+            entries = {}
+            if os.path.exists(self.path):
+                with open(self.path, "r") as f:
+                    for line in f:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            continue  # Torn final line from an interrupted write
+                        entries[record["k"]] = record["r"]
+            self._entries = entries
+        return self._entries
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._load().get(key)
+
+    def put(self, key: str, response: Dict[str, Any]):
+        with self._lock:
+            entries = self._load()
+            if entries.get(key) == response:
+                return
+            entries[key] = response
+            record = {"k": key, "r": response, "ts": int(time.time())}
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    def compact(self):
+        """Rewrite the file keeping only the latest response per query"""
+        with self._lock:
+            entries = self._load()
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                for key, response in entries.items():
+                    f.write(json.dumps({"k": key, "r": response, "ts": int(time.time())}, separators=(",", ":")) + "\n")
+            os.replace(tmp_path, self.path)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._load())
+
+class OmdbTransport:
+    """Sends OMDb queries over HTTP or serves them from the cassette store"""
+
+    def __init__(self, base_url: str, mode: str = OMDB_TRANSPORT_MODE, store: Optional[CassetteStore] = None):
+        if mode not in TRANSPORT_MODES:
+            raise ValueError(f"Unknown OMDb transport mode: {mode}")
+        self.base_url = base_url
+        self.mode = mode
+        self.store = store or CassetteStore()
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        # Keep-alive per thread instead of a new connection per call
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def cached(self, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Recorded response for a query, without touching the network"""
+        response = self.store.get(cassette_key(params))
+        if response is None:
+            cache_miss("omdb_cassette")
+        else:
+            cache_hit("omdb_cassette")
+        return response
+
+    def fetch(self, params: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        """Answer an OMDb query according to the transport mode"""
+        if self.mode == "replay":
+            response = self.cached(params)
+            TRANSPORT_RESPONSES.inc(mode=self.mode, source="cassette" if response is not None else "miss")
+            return response if response is not None else dict(OFFLINE_MISS)
+
+        try:
+            response = self._session().get(self.base_url, params=params, timeout=timeout)
+            response.raise_for_status()
+            data = response.json()
+        except Exception:
+            if self.mode == "record":
+                # Upstream is failing, keep serving what we recorded earlier
+                recorded = self.cached(params)
+                if recorded is not None:
+                    TRANSPORT_RESPONSES.inc(mode=self.mode, source="cassette")
+                    logger.warning("OMDb unavailable, served recorded response", extra={"query": cassette_key(params)})
+                    return recorded
+            raise
+
+        TRANSPORT_RESPONSES.inc(mode=self.mode, source="network")
+        if self.mode == "record" and not str(data.get("Error", "")).lower().startswith(_TRANSIENT_ERRORS):
+            self.store.put(cassette_key(params), data)
+        return data
@@ -1,13 +1,123 @@
+import contextvars
 import requests
 import json
 import os
+import time
+import logging
+from contextlib import contextmanager
 from typing import List, Dict, Any, Optional
 
+from metrics import Counter, Histogram
+from profiling import span
+from omdb_transport import OmdbTransport, cassette_key
+from singleflight import SingleFlight
+from omdb_scheduler import scheduler, current_priority, lowered_priority, RECOMMEND
+import popular_snapshot
+from query_normalizer import normalize_description
+
+logger = logging.getLogger(__name__)
+
 # API credentials
-OMDB_API_KEY = "42d83121"  # API key for movie data
+OMDB_API_KEY = os.environ.get("OMDB_API_KEY", "42d83121")  # API key for movie data
+
+# API endpoint (overridable so benchmarks can point at a local stand-in)
+OMDB_BASE_URL = os.environ.get("OMDB_BASE_URL", "http://www.omdbapi.com/")
+OMDB_TIMEOUT = 10  # Seconds before giving up on a slow upstream call
+
+OMDB_REQUESTS = Counter("omdb_requests_total", "OMDb calls by function and outcome", ["function", "outcome"])
+OMDB_LATENCY = Histogram("omdb_request_duration_seconds", "OMDb call latency by function", ["function"])
+
+# Live, record or replay (offline) access to OMDb, see omdb_transport
+transport = OmdbTransport(OMDB_BASE_URL)
+
+# Curated titles used as fallbacks and for well-known descriptions
+POPULAR_TITLES = [
+    "The Shawshank Redemption",
+    "The Godfather",
+    "The Dark Knight",
+    "Pulp Fiction",
+    "Inception",
+    "Fight Club",
+    "Forrest Gump",
+    "The Matrix",
+    "Goodfellas",
+    "Interstellar"
+]
+
+MOVIE_PATTERNS = [
+    {"keywords": ["boy", "boat", "tiger"], "title": "Life of Pi"},
+    {"keywords": ["dream", "inception", "dreams", "within"], "title": "Inception"},
+    {"keywords": ["space", "interstellar", "wormhole"], "title": "Interstellar"},
+    {"keywords": ["prison", "escape", "shawshank"], "title": "The Shawshank Redemption"},
+    {"keywords": ["mafia", "godfather", "family", "crime"], "title": "The Godfather"},
+    {"keywords": ["batman", "joker", "dark", "knight"], "title": "The Dark Knight"},
+    {"keywords": ["matrix", "neo", "reality", "simulation"], "title": "The Matrix"},
+    {"keywords": ["club", "fight", "tyler", "durden"], "title": "Fight Club"},
+    {"keywords": ["time", "travel", "future", "back"], "title": "Back to the Future"},
+    {"keywords": ["dinosaur", "jurassic", "park"], "title": "Jurassic Park"}
+]
+
+# Identical lookups in flight at the same time share one upstream call
+omdb_flights = SingleFlight("omdb")
+
+# Set while a shed request is answered from recorded data only
+_cache_only = contextvars.ContextVar("omdb_cache_only", default=False)
+
+@contextmanager
+def cache_only():
+    """Serve OMDb calls in this block from recorded responses without going upstream"""
+    token = _cache_only.set(True)
+    try:
+        yield
+    finally:
+        _cache_only.reset(token)
+
+def _omdb_request(function: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Call OMDb, coalescing with any identical query already in flight"""
+    # Normalized title/year, imdbID or search term; the API key is not part of it.
+    # Callers only share with a leader of the same priority, so an interactive
+    # lookup never waits in a lower priority's scheduler queue or gets its
+    # budget-exhausted answer
+    key = (current_priority(), cassette_key(params))
+    with span("omdb", function=function):  # Includes waiting on a coalesced call
+        if _cache_only.get():
+            # A local lookup: neither wait on a live call nor hand its answer to one
+            return _omdb_fetch(function, params)
+        return omdb_flights.do(key, lambda: _omdb_fetch(function, params))
+
+def coalescing_stats() -> Dict[str, Any]:
+    """How many OMDb lookups were shared with an in-flight identical call"""
+    return omdb_flights.stats()
+
+def _omdb_fetch(function: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Call OMDb and record latency and outcome for the calling function"""
+    if _cache_only.get():
+        allowed = transport.mode == "replay"
+    else:
+        with span("omdb.quota_wait"):
+            allowed = transport.mode == "replay" or scheduler.acquire()
+    if not allowed:
+        # Budget is kept for higher priorities, answer from recorded data only
+        OMDB_REQUESTS.inc(function=function, outcome="degraded")
+        cached = transport.cached(params)
+        return cached if cached is not None else {"Response": "False", "Error": "OMDb budget exhausted"}
 
-# API endpoint
-OMDB_BASE_URL = "http://www.omdbapi.com/"
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        with span("omdb.fetch", function=function):
+            data = transport.fetch(params, OMDB_TIMEOUT)
+        if data.get("Response") == "True":
+            outcome = "ok"
+        elif "limit" in str(data.get("Error", "")).lower():
+            outcome = "rate_limited"
+            scheduler.mark_exhausted()
+        else:
+            outcome = "not_found"
+        return data
+    finally:
+        OMDB_LATENCY.observe(time.perf_counter() - start, function=function)
+        OMDB_REQUESTS.inc(function=function, outcome=outcome)
 
 def search_movies(query: str, page: int = 1) -> Dict[str, Any]:
     """Search for movies by title or keywords"""
@@ -19,17 +129,15 @@ def search_movies(query: str, page: int = 1) -> Dict[str, Any]:
     }
     
     try:
-        response = requests.get(OMDB_BASE_URL, params=params)
-        response.raise_for_status()
-        data = response.json()
+        data = _omdb_request("search_movies", params)
         
         if data.get("Response") == "True":
             return data
         else:
-            print(f"OMDb API error: {data.get('Error', 'Unknown error')}")
+            logger.info("OMDb API error", extra={"function": "search_movies", "error": data.get("Error", "Unknown error")})
             return {"Search": [], "totalResults": "0"}
     except Exception as e:
-        print(f"Error searching OMDb: {e}")
+        logger.warning("Error searching OMDb", extra={"function": "search_movies", "error": str(e)})
         return {"Search": [], "totalResults": "0"}
 
 def get_movie_details(title: str, year: str = None) -> Dict[str, Any]:
@@ -44,17 +152,15 @@ def get_movie_details(title: str, year: str = None) -> Dict[str, Any]:
         params["y"] = year
     
     try:
-        response = requests.get(OMDB_BASE_URL, params=params)
-        response.raise_for_status()
-        data = response.json()
+        data = _omdb_request("get_movie_details", params)
         
         if data.get("Response") == "True":
             return data
         else:
-            print(f"OMDb API error: {data.get('Error', 'Unknown error')}")
+            logger.info("OMDb API error", extra={"function": "get_movie_details", "error": data.get("Error", "Unknown error")})
             return {}
     except Exception as e:
-        print(f"Error getting movie details from OMDb: {e}")
+        logger.warning("Error getting movie details from OMDb", extra={"function": "get_movie_details", "error": str(e)})
         return {}
 
 def get_movie_by_id(imdb_id: str) -> Dict[str, Any]:
@@ -66,17 +172,15 @@ def get_movie_by_id(imdb_id: str) -> Dict[str, Any]:
     }
     
     try:
-        response = requests.get(OMDB_BASE_URL, params=params)
-        response.raise_for_status()
-        data = response.json()
+        data = _omdb_request("get_movie_by_id", params)
         
         if data.get("Response") == "True":
             return data
         else:
-            print(f"OMDb API error: {data.get('Error', 'Unknown error')}")
+            logger.info("OMDb API error", extra={"function": "get_movie_by_id", "error": data.get("Error", "Unknown error")})
             return {}
     except Exception as e:
-        print(f"Error getting movie details from OMDb: {e}")
+        logger.warning("Error getting movie details from OMDb", extra={"function": "get_movie_by_id", "error": str(e)})
         return {}
 
 def format_movie_data(omdb_movie: Dict[str, Any]) -> Dict[str, Any]:
@@ -134,37 +238,29 @@ def fetch_movies_by_keyword(keyword: str, count: int = 10) -> List[Dict[str, Any
     
     return movies
 
+def description_cache_key(description: str) -> tuple:
+    """Everything search_by_description's result depends on, so equal keys mean equal answers
+
+    Drops stop words and punctuation but keeps word order. Queries with no
+    usable words still differ by their matched patterns and phrases.
+    """
+    keywords, phrases, _ = normalize_description(description)
+    description_lower = description.lower()
+    matched = tuple(pattern["title"] for pattern in MOVIE_PATTERNS
+                    if any(keyword in description_lower for keyword in pattern["keywords"]))
+    if not (matched or phrases or keywords):
+        return ("raw", " ".join(description_lower.split()))
+    return matched, tuple(phrases[:3]), tuple(keywords[:5])
+
+@lowered_priority(RECOMMEND)
 def search_by_description(description: str, count: int = 10) -> List[Dict[str, Any]]:
     """Find movies that match a vague description or theme"""
-    print(f"Searching for movies matching description: {description}")
-    
-    # Break description into words
-    words = description.lower().split()
-    
-    # Skip common words that don't help with search
-    common_words = {
-        "a", "an", "the", "and", "or", "but", "in", "on", "at", "to", "for", "with", 
-        "about", "from", "by", "is", "are", "was", "were", "be", "been", "being", 
-        "have", "has", "had", "do", "does", "did", "will", "would", "should", "can", 
-        "could", "may", "might", "must", "that", "which", "who", "whom", "whose", 
-        "what", "where", "when", "why", "how", "movie", "film", "watch", "see", "like"
-    }
+    logger.info("Searching for movies matching description", extra={"description": description})
     
     # Find useful search terms
-    keywords = []
-    phrases = []
-    
-    # Look for meaningful two-word combinations
-    if len(words) >= 2:
-        for i in range(len(words) - 1):
-            if words[i] not in common_words and words[i+1] not in common_words:
-                phrases.append(f"{words[i]} {words[i+1]}")
-    
-    # Keep meaningful single words
-    keywords = [word for word in words if word not in common_words and len(word) > 2]
+    keywords, phrases, _ = normalize_description(description)
     
-    print(f"Extracted keywords: {keywords}")
-    print(f"Extracted phrases: {phrases}")
+    logger.debug("Extracted search terms", extra={"keywords": keywords, "phrases": phrases})
     
     # Start collecting results
     all_movies = []
@@ -172,26 +268,14 @@ def search_by_description(description: str, count: int = 10) -> List[Dict[str, A
     # Look for specific movie themes
     description_lower = description.lower()
     
-    # Known movie patterns to check against
-    movie_patterns = [
-        {"keywords": ["boy", "boat", "tiger"], "title": "Life of Pi"},
-        {"keywords": ["dream", "inception", "dreams", "within"], "title": "Inception"},
-        {"keywords": ["space", "interstellar", "wormhole"], "title": "Interstellar"},
-        {"keywords": ["prison", "escape", "shawshank"], "title": "The Shawshank Redemption"},
-        {"keywords": ["mafia", "godfather", "family", "crime"], "title": "The Godfather"},
-        {"keywords": ["batman", "joker", "dark", "knight"], "title": "The Dark Knight"},
-        {"keywords": ["matrix", "neo", "reality", "simulation"], "title": "The Matrix"},
-        {"keywords": ["club", "fight", "tyler", "durden"], "title": "Fight Club"},
-        {"keywords": ["time", "travel", "future", "back"], "title": "Back to the Future"},
-        {"keywords": ["dinosaur", "jurassic", "park"], "title": "Jurassic Park"}
-    ]
-    
     # Try to match description to known movies
-    for pattern in movie_patterns:
+    for pattern in MOVIE_PATTERNS:
         if any(keyword in description_lower for keyword in pattern["keywords"]):
-            movie_details = get_movie_details(pattern["title"])
-            if movie_details:
-                formatted = format_movie_data(movie_details)
+            formatted = popular_snapshot.get_movie(pattern["title"])
+            if formatted is None:
+                movie_details = get_movie_details(pattern["title"])
+                formatted = format_movie_data(movie_details) if movie_details else None
+            if formatted:
                 all_movies.append(formatted)
     
     # Search using two-word phrases
@@ -249,23 +333,16 @@ def search_by_description(description: str, count: int = 10) -> List[Dict[str, A
     
     return all_movies[:count]  # Return only the requested number of movies
 
+@lowered_priority(RECOMMEND)
 def fetch_popular_movies() -> List[Dict[str, Any]]:
     """Get a list of well-known movies as fallback"""
-    popular_titles = [
-        "The Shawshank Redemption",
-        "The Godfather",
-        "The Dark Knight",
-        "Pulp Fiction",
-        "Inception",
-        "Fight Club",
-        "Forrest Gump",
-        "The Matrix",
-        "Goodfellas",
-        "Interstellar"
-    ]
-    
+    # Served from memory once the background snapshot exists
+    snapshot_movies = popular_snapshot.popular_movies()
+    if snapshot_movies is not None:
+        return snapshot_movies
+
     movies = []
-    for title in popular_titles:
+    for title in POPULAR_TITLES:
         movie_details = get_movie_details(title)
         if movie_details:
             formatted_movie = format_movie_data(movie_details)
@@ -0,0 +1,155 @@
+import os
+import threading
+import time
+import logging
+from typing import Dict, Any, List, Optional
+
+from metrics import Gauge, cache_hit, cache_miss
+import fast_json
+from omdb_scheduler import omdb_priority, BACKGROUND
+import coordination
+
+try:
+    import fcntl  # Lets one worker build while the others wait for the file
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Materialized curated movies (popular fallback list and description patterns)
+SNAPSHOT_FILE = os.environ.get("POPULAR_SNAPSHOT_FILE", "popular_snapshot.json")
+SNAPSHOT_REFRESH_SECONDS = int(os.environ.get("POPULAR_SNAPSHOT_REFRESH_SECONDS", str(6 * 60 * 60)))
+# A build missing some titles (OMDb down or over quota) is retried this much sooner
+SNAPSHOT_RETRY_SECONDS = int(os.environ.get("POPULAR_SNAPSHOT_RETRY_SECONDS", "300"))
+# Builds resolving less than this share of the titles are not published at all
+SNAPSHOT_MIN_COMPLETE = 0.5
+
+_refresher = None
+
+def _title_key(title: str) -> str:
+    return " ".join(title.lower().split())
+
+def _read_file() -> Optional[Dict[str, Any]]:
+    if not os.path.exists(SNAPSHOT_FILE):
+        return None
+    try:
+        with open(SNAPSHOT_FILE, "rb") as f:
+            return fast_json.load(f)
+    except ValueError:
+        logger.warning("Ignoring unreadable popular snapshot", extra={"path": SNAPSHOT_FILE})
+        return None
+
+# Replaced as a whole when any worker rebuilds, readers never see a half-built snapshot
+_snapshot_cache = coordination.GenerationCache(coordination.POPULAR_SNAPSHOT, _read_file)
+
+def _current() -> Optional[Dict[str, Any]]:
+    return _snapshot_cache.get()
+
+def get_movie(title: str) -> Optional[Dict[str, Any]]:
+    """Curated movie from the snapshot, or None if it hasn't been materialized"""
+    snapshot = _current()
+    movie = snapshot["movies"].get(_title_key(title)) if snapshot else None
+    if movie is None:
+        cache_miss("popular_snapshot")
+        return None
+    cache_hit("popular_snapshot")
+    return dict(movie)
+
+def popular_movies() -> Optional[List[Dict[str, Any]]]:
+    """The popular fallback list in curated order, or None until a snapshot exists"""
+    snapshot = _current()
+    if not snapshot or not snapshot["popular"]:
+        cache_miss("popular_snapshot")
+        return None
+    cache_hit("popular_snapshot")
+    movies = snapshot["movies"]
+    resolved = [dict(movies[key]) for key in snapshot["popular"] if key in movies]
+    return resolved or None  # Let callers fall back to fetching live
+
+def build_snapshot() -> Optional[Dict[str, Any]]:
+    """Fetch every curated title once and atomically replace the snapshot
+
+    Returns None without touching the current snapshot when too few titles resolved.
+    """
+    from omdb_utils import POPULAR_TITLES, MOVIE_PATTERNS, get_movie_details, format_movie_data
+
+    previous = _current() or {"movies": {}}
+    titles = list(dict.fromkeys(POPULAR_TITLES + [pattern["title"] for pattern in MOVIE_PATTERNS]))
+
+    movies = {}
+    with omdb_priority(BACKGROUND):
+        for title in titles:
+            key = _title_key(title)
+            details = get_movie_details(title)
+            if details:
+                movies[key] = format_movie_data(details)
+            elif key in previous["movies"]:
+                movies[key] = previous["movies"][key]  # Keep the last good copy through upstream failures
+
+    if len(movies) < len(titles) * SNAPSHOT_MIN_COMPLETE:
+        logger.warning("Popular snapshot not published, too few titles resolved",
+                       extra={"movies": len(movies), "titles": len(titles)})
+        return None
+
+    snapshot = {
+        "built_at": time.time(),
+        "complete": len(movies) == len(titles),
+        "popular": [_title_key(title) for title in POPULAR_TITLES],
+        "movies": movies,
+    }
+
+    tmp_path = f"{SNAPSHOT_FILE}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        fast_json.dump(snapshot, f)
+    os.replace(tmp_path, SNAPSHOT_FILE)
+    coordination.bump(coordination.POPULAR_SNAPSHOT)
+
+    logger.info("Popular snapshot built", extra={"movies": len(movies), "titles": len(titles)})
+    return snapshot
+
+def _is_stale(snapshot: Optional[Dict[str, Any]]) -> bool:
+    if snapshot is None:
+        return True
+    max_age = SNAPSHOT_REFRESH_SECONDS if snapshot.get("complete", True) else SNAPSHOT_RETRY_SECONDS
+    return time.time() - snapshot.get("built_at", 0) >= max_age
+
+def refresh_if_stale():
+    """Rebuild when the snapshot is missing or old; only one worker builds at a time"""
+    if not _is_stale(_current()):
+        return
+
+    if fcntl is None:
+        build_snapshot()
+        return
+
+    with open(f"{SNAPSHOT_FILE}.lock", "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return  # Someone else is building, pick it up next round
+        # Re-check now that we hold the lock, another worker may have just built it
+        if not _is_stale(_read_file()):
+            return
+        build_snapshot()
+
+def _refresh_loop():
+    while True:
+        try:
+            refresh_if_stale()
+        except Exception:
+            logger.exception("Popular snapshot refresh failed")
+        # Check more often than the refresh period in case a build failed or came out partial
+        time.sleep(min(SNAPSHOT_REFRESH_SECONDS, SNAPSHOT_RETRY_SECONDS))
+
+def start_refresher():
+    """Build or load the snapshot in the background and keep it fresh"""
+    global _refresher
+    if _refresher is None:
+        _refresher = threading.Thread(target=_refresh_loop, name="popular-snapshot", daemon=True)
+        _refresher.start()
+
+def _snapshot_age():
+    snapshot = _current()
+    return {(): time.time() - snapshot["built_at"]} if snapshot else {}
+
+SNAPSHOT_AGE = Gauge("popular_snapshot_age_seconds", "Age of the in-memory popular movies snapshot", callback=_snapshot_age)
@@ -0,0 +1,243 @@
+import hashlib
+import io
+import os
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+from urllib.parse import urlsplit
+
+import requests
+
+from metrics import Counter, Gauge, Histogram, cache_hit, cache_miss
+from singleflight import SingleFlight
+
+try:
+    from PIL import Image  # Without Pillow, thumbnail requests get the original image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Poster images fetched once and kept on local disk
+POSTER_CACHE_DIR = os.environ.get("POSTER_CACHE_DIR", "poster_cache")
+POSTER_CACHE_MAX_BYTES = int(os.environ.get("POSTER_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# Only these hosts are fetched, so the proxy can't be pointed at arbitrary URLs
+POSTER_ALLOWED_HOSTS = {
+    host.strip().lower()
+    for host in os.environ.get(
+        "POSTER_ALLOWED_HOSTS", "m.media-amazon.com,images-na.ssl-images-amazon.com,ia.media-imdb.com"
+    ).split(",")
+    if host.strip()
+}
+POSTER_FETCH_TIMEOUT = 10
+POSTER_MAX_IMAGE_BYTES = 10 * 1024 * 1024
+THUMB_SIZE = (int(os.environ.get("POSTER_THUMB_WIDTH", "200")), int(os.environ.get("POSTER_THUMB_HEIGHT", "296")))
+THUMB_QUALITY = 80
+
+# Decoding and resizing release the GIL in Pillow, so threads run them in parallel
+_thumb_pool = ThreadPoolExecutor(max_workers=int(os.environ.get("POSTER_WORKERS", "2")), thread_name_prefix="poster-thumb")
+_fetches = SingleFlight("poster_fetch")
+_thumbs = SingleFlight("poster_thumb")
+_local = threading.local()
+_size_lock = threading.Lock()
+_cache_bytes = None  # Approximate bytes on disk, scanned on first use
+
+POSTER_FETCH_LATENCY = Histogram("poster_fetch_duration_seconds", "Time to download a poster from upstream")
+POSTER_THUMB_LATENCY = Histogram("poster_thumbnail_duration_seconds", "Time to resize a poster into a thumbnail")
+POSTER_EVICTIONS = Counter("poster_cache_evictions_total", "Cached poster files removed to stay under the size limit")
+POSTER_CACHE_BYTES = Gauge("poster_cache_bytes", "Approximate size of the poster cache on disk",
+                           callback=lambda: {(): _cache_bytes} if _cache_bytes is not None else {})
+
+class PosterError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+class CachedPoster(NamedTuple):
+    etag: str  # Content hash, plus the size for thumbnails
+    media_type: str
+    data: bytes  # Read while the file was known to exist, eviction can remove it any time after
+
+def _session() -> requests.Session:
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = _local.session = requests.Session()
+    return session
+
+def _path(*parts: str) -> str:
+    return os.path.join(POSTER_CACHE_DIR, *parts)
+
+def _original_path(digest: str) -> str:
+    return _path("originals", digest[:2], digest)
+
+def _thumb_path(digest: str) -> str:
+    return _path("thumbs", digest[:2], f"{digest}-{THUMB_SIZE[0]}x{THUMB_SIZE[1]}.jpg")
+
+def _url_path(url: str) -> str:
+    return _path("urls", hashlib.sha1(url.encode("utf-8")).hexdigest())
+
+def check_url(url: str):
+    """Raise PosterError unless url is an http(s) URL on an allowed host"""
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise PosterError(400, "Poster URL must be http or https")
+    if parts.hostname.lower() not in POSTER_ALLOWED_HOSTS:
+        raise PosterError(403, "Poster host is not allowed")
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    _account(len(data))
+
+def _touch(path: str) -> bool:
+    """Mark a cached file as recently used; False if it was evicted"""
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+def _media_type(data: bytes) -> str:
+    if data[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return ""
+
+def _download(url: str) -> str:
+    """Fetch a poster and store it under its content hash; returns the hash"""
+    start = time.perf_counter()
+    try:
+        with _session().get(url, timeout=POSTER_FETCH_TIMEOUT, stream=True) as response:
+            response.raise_for_status()
+            chunks, size = [], 0
+            for chunk in response.iter_content(64 * 1024):
+                size += len(chunk)
+                if size > POSTER_MAX_IMAGE_BYTES:
+                    raise PosterError(502, "Poster is too large")
+                chunks.append(chunk)
+    except requests.RequestException as e:
+        raise PosterError(502, f"Could not fetch poster: {e}")
+    finally:
+        POSTER_FETCH_LATENCY.observe(time.perf_counter() - start)
+
+    data = b"".join(chunks)
+    if not _media_type(data):
+        raise PosterError(502, "Upstream did not return an image")
+    digest = hashlib.sha256(data).hexdigest()
+    if not _touch(_original_path(digest)):
+        _write_atomic(_original_path(digest), data)
+    _write_atomic(_url_path(url), digest.encode())
+    return digest
+
+def _original_digest(url: str) -> str:
+    """Content hash of a URL's poster, downloading it on first use"""
+    try:
+        with open(_url_path(url), "r") as f:
+            digest = f.read().strip()
+        if _touch(_original_path(digest)):
+            cache_hit("poster")
+            return digest
+    except FileNotFoundError:
+        pass
+    cache_miss("poster")
+    return _fetches.do(url, lambda: _download(url))
+
+def _make_thumbnail(digest: str) -> str:
+    path = _thumb_path(digest)
+    with POSTER_THUMB_LATENCY.time():
+        with Image.open(_original_path(digest)) as image:
+            image = image.convert("RGB")
+            image.thumbnail(THUMB_SIZE)
+            output = io.BytesIO()
+            image.save(output, "JPEG", quality=THUMB_QUALITY, optimize=True)
+    _write_atomic(path, output.getvalue())
+    return path
+
+def get_poster(url: str, thumbnail: bool = False) -> CachedPoster:
+    """Cached original or thumbnail for a poster URL, fetching and resizing as needed"""
+    check_url(url)
+    try:
+        return _load_poster(url, thumbnail)
+    except FileNotFoundError:
+        # Evicted between lookup and read; this pass fetches or resizes it again
+        return _load_poster(url, thumbnail)
+
+def _load_poster(url: str, thumbnail: bool) -> CachedPoster:
+    digest = _original_digest(url)
+    original = _original_path(digest)
+
+    if thumbnail and Image is not None:
+        path = _thumb_path(digest)
+        if _touch(path):
+            cache_hit("poster_thumb")
+        else:
+            cache_miss("poster_thumb")
+            try:
+                path = _thumbs.do(digest, lambda: _thumb_pool.submit(_make_thumbnail, digest).result())
+            except FileNotFoundError:
+                raise  # Original evicted before resizing, get_poster retries
+            except (OSError, ValueError) as e:
+                raise PosterError(502, f"Could not resize poster: {e}")
+        with open(path, "rb") as f:
+            data = f.read()
+        _evict_if_needed()
+        return CachedPoster(f"{digest}-{THUMB_SIZE[0]}x{THUMB_SIZE[1]}", "image/jpeg", data)
+
+    with open(original, "rb") as f:
+        data = f.read()
+    _evict_if_needed()
+    return CachedPoster(digest, _media_type(data), data)
+
+def _scan():
+    """(mtime, size, path) for every cached file"""
+    files = []
+    for root, _, names in os.walk(POSTER_CACHE_DIR):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+    return files
+
+def _account(size: int):
+    global _cache_bytes
+    with _size_lock:
+        if _cache_bytes is None:
+            _cache_bytes = sum(size for _, size, _ in _scan())
+        else:
+            _cache_bytes += size
+
+def _evict_if_needed():
+    """Remove least recently used files until the cache is under 90% of its limit"""
+    global _cache_bytes
+    if _cache_bytes is None or _cache_bytes <= POSTER_CACHE_MAX_BYTES:
+        return
+    with _size_lock:
+        files = sorted(_scan())
+        total = sum(size for _, size, _ in files)
+        target = POSTER_CACHE_MAX_BYTES * 0.9
+        for _, size, path in files:
+            if total <= target:
+                break
+            if os.sep + "urls" + os.sep in path:
+                continue  # Tiny, and a missing original is refetched anyway
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            POSTER_EVICTIONS.inc()
+        _cache_bytes = total
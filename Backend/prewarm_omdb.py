@@ -0,0 +1,39 @@
+import argparse
+from typing import List
+
+import omdb_utils
+from omdb_scheduler import omdb_priority, BACKGROUND
+from omdb_utils import POPULAR_TITLES, MOVIE_PATTERNS, get_movie_details, fetch_movies_by_keyword
+
+def prewarm(titles: List[str], keywords: List[str]) -> int:
+    """Record OMDb lookups into the cassette so replay mode can serve them offline"""
+    omdb_utils.transport.mode = "record"
+
+    all_titles = list(dict.fromkeys(POPULAR_TITLES + [p["title"] for p in MOVIE_PATTERNS] + titles))
+    print(f"Recording {len(all_titles)} titles and {len(keywords)} keyword searches...")
+
+    with omdb_priority(BACKGROUND):
+        for title in all_titles:
+            if not get_movie_details(title):
+                print(f"  No result for {title}")
+        for keyword in keywords:
+            fetch_movies_by_keyword(keyword, count=10)
+
+    omdb_utils.transport.store.compact()
+    recorded = len(omdb_utils.transport.store)
+    print(f"Cassette {omdb_utils.transport.store.path} now holds {recorded} responses")
+    return recorded
+
+def _read_lines(path: str) -> List[str]:
+    if not path:
+        return []
+    with open(path, "r") as f:
+        return [line.strip() for line in f if line.strip()]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-warm the OMDb cassette at deploy time")
+    parser.add_argument("--titles-file", help="Extra titles to record, one per line")
+    parser.add_argument("--keywords-file", help="Keyword searches to record, one per line")
+    args = parser.parse_args()
+
+    prewarm(_read_lines(args.titles_file), _read_lines(args.keywords_file))
@@ -0,0 +1,171 @@
+import contextvars
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+import logging
+from contextlib import nullcontext
+from typing import Any, Dict, List, Optional
+
+import fast_json
+
+logger = logging.getLogger(__name__)
+
+# Fraction of requests profiled without being asked, 0 turns sampling off
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+# Requests sending this header with PROFILE_TOKEN as its value are always profiled
+PROFILE_HEADER = "x-profile"
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", "200"))
+PROFILE_INTERVAL_SECONDS = float(os.environ.get("PROFILE_INTERVAL_MS", "5")) / 1000
+
+# Profile of the request being handled, None almost always
+_active: contextvars.ContextVar[Optional["Profile"]] = contextvars.ContextVar("profile", default=None)
+_noop = nullcontext()
+_write_lock = threading.Lock()
+
+class Profile:
+    """Stage timings and sampled stacks for one request"""
+
+    def __init__(self, method: str, path: str, reason: str):
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.method = method
+        self.path = path
+        self.reason = reason
+        self.start = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.stacks: Dict[str, int] = {}  # Folded stack -> samples
+        self.threads: Dict[int, int] = {}  # Thread id -> open spans on it
+        self.closed = False
+        self.token = None
+        self._lock = threading.Lock()
+        self._sampler = threading.Thread(target=self._sample, name=f"profiler-{self.id}", daemon=True)
+        self._sampler.start()
+
+    def _sample(self):
+        """Record where each thread inside a span is, every PROFILE_INTERVAL_SECONDS"""
+        while not self.closed:
+            time.sleep(PROFILE_INTERVAL_SECONDS)
+            with self._lock:
+                thread_ids = list(self.threads)
+            if not thread_ids:
+                continue
+            frames = sys._current_frames()
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                    frame = frame.f_back
+                folded = ";".join(reversed(stack))
+                with self._lock:
+                    self.stacks[folded] = self.stacks.get(folded, 0) + 1
+
+    def finish(self, status: int) -> Dict[str, Any]:
+        self.closed = True
+        self._sampler.join()
+        stages: Dict[str, Dict[str, float]] = {}
+        for recorded in self.spans:
+            stage = stages.setdefault(recorded["name"], {"count": 0, "total_ms": 0.0})
+            stage["count"] += 1
+            stage["total_ms"] = round(stage["total_ms"] + recorded["duration_ms"], 3)
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "reason": self.reason,
+            "status": status,
+            "duration_ms": round((time.perf_counter() - self.start) * 1000, 3),
+            "stages": stages,
+            "spans": self.spans,
+            "samples": dict(sorted(self.stacks.items(), key=lambda item: -item[1])),
+            "sample_interval_ms": PROFILE_INTERVAL_SECONDS * 1000,
+        }
+
+class _Span:
+    def __init__(self, profile: Profile, name: str, attrs: Dict[str, Any]):
+        self.profile = profile
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.thread_id = threading.get_ident()
+        with self.profile._lock:
+            self.depth = self.profile.threads.get(self.thread_id, 0)
+            self.profile.threads[self.thread_id] = self.depth + 1
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter()
+        profile = self.profile
+        with profile._lock:
+            if self.depth:
+                profile.threads[self.thread_id] = self.depth
+            else:
+                profile.threads.pop(self.thread_id, None)
+            if not profile.closed:  # Background work may outlive the request
+                profile.spans.append({
+                    "name": self.name,
+                    "start_ms": round((self.start - profile.start) * 1000, 3),
+                    "duration_ms": round((end - self.start) * 1000, 3),
+                    "depth": self.depth,
+                    "thread": self.thread_id,
+                    **self.attrs,
+                })
+        return False
+
+def span(name: str, **attrs):
+    """Time a stage of the current request when it is being profiled, otherwise do nothing"""
+    profile = _active.get()
+    if profile is None:
+        return _noop
+    return _Span(profile, name, attrs)
+
+def should_profile(headers) -> Optional[str]:
+    """Why this request should be profiled, or None"""
+    if PROFILE_TOKEN and headers.get(PROFILE_HEADER) == PROFILE_TOKEN:
+        return "header"
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return "sampled"
+    return None
+
+def start(method: str, path: str, reason: str) -> Profile:
+    """Begin profiling the current request"""
+    profile = Profile(method, path, reason)
+    profile.token = _active.set(profile)
+    return profile
+
+def stop(profile: Profile):
+    """Stop attributing spans to the profile; call from the context that started it"""
+    _active.reset(profile.token)
+    profile.closed = True
+
+def save(profile: Profile, status: int) -> Dict[str, Any]:
+    """Finish a stopped profile and write it to PROFILE_DIR"""
+    result = profile.finish(status)
+    try:
+        _write(result)
+    except OSError:
+        logger.exception("Could not write profile", extra={"profile": profile.id})
+    return result
+
+def _write(result: Dict[str, Any]):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(os.path.join(PROFILE_DIR, f"{result['id']}.json"), "wb") as f:
+        fast_json.dump(result, f)
+    with _write_lock:
+        # Keep only the newest PROFILE_MAX_FILES profiles
+        entries = sorted((entry for entry in os.scandir(PROFILE_DIR) if entry.name.endswith(".json")),
+                         key=lambda entry: entry.stat().st_mtime_ns)
+        for entry in entries[:max(0, len(entries) - PROFILE_MAX_FILES)]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,35 @@
+import re
+from typing import List, NamedTuple
+
+# Words that don't help with search
+COMMON_WORDS = {
+    "a", "an", "the", "and", "or", "but", "in", "on", "at", "to", "for", "with",
+    "about", "from", "by", "is", "are", "was", "were", "be", "been", "being",
+    "have", "has", "had", "do", "does", "did", "will", "would", "should", "can",
+    "could", "may", "might", "must", "that", "which", "who", "whom", "whose",
+    "what", "where", "when", "why", "how", "movie", "film", "watch", "see", "like"
+}
+
+_PUNCTUATION = re.compile(r"[^\w\s'-]")
+
+class NormalizedQuery(NamedTuple):
+    keywords: List[str]  # Meaningful single words, in query order
+    phrases: List[str]  # Adjacent pairs of meaningful words
+    canonical: str  # Order-insensitive form shared by near-identical descriptions
+
+def normalize_description(description: str) -> NormalizedQuery:
+    """Extract search terms from a vague description and build its canonical form"""
+    words = _PUNCTUATION.sub(" ", description.lower()).split()
+
+    # Look for meaningful two-word combinations
+    phrases = []
+    for i in range(len(words) - 1):
+        if words[i] not in COMMON_WORDS and words[i + 1] not in COMMON_WORDS:
+            phrases.append(f"{words[i]} {words[i + 1]}")
+
+    # Keep meaningful single words
+    keywords = [word for word in words if word not in COMMON_WORDS and len(word) > 2]
+
+    # "movie about a boy on a boat with a tiger" and "boy boat tiger film" -> "boat boy tiger"
+    canonical = " ".join(sorted(set(keywords)))
+    return NormalizedQuery(keywords, phrases, canonical)
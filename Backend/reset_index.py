@@ -1,12 +1,6 @@
-import os
-import json
-import numpy as np
 import faiss
-
-# Constants
-VECTOR_DIMENSION = 384  # Dimension of embeddings for the model
-INDEX_FILE = "movie_vectors.faiss"
-MOVIE_EMBEDDINGS_FILE = "movie_embeddings.json"
+import coordination
+from vector_search import VECTOR_DIMENSION, save_index
 
 def create_empty_index():
     """Create and save an empty FAISS index"""
@@ -15,13 +9,12 @@ def create_empty_index():
     # Create empty FAISS index
     index = faiss.IndexFlatL2(VECTOR_DIMENSION)
     
-    # Save index
-    print(f"Saving empty index to {INDEX_FILE}")
-    faiss.write_index(index, INDEX_FILE)
+    # Save index with an empty movie embeddings mapping
+    print("Saving empty index")
+    save_index(index, {})
     
-    # Save empty movie embeddings mapping
-    with open(MOVIE_EMBEDDINGS_FILE, 'w') as f:
-        json.dump({}, f, indent=2)
+    # Running workers drop their loaded index
+    coordination.bump(coordination.INDEX)
     
     print("Reset complete! All movie recommendations have been removed.")
 
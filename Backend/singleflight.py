@@ -0,0 +1,73 @@
+import copy
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable
+
+from metrics import Counter, Histogram
+
+SINGLEFLIGHT_CALLS = Counter("singleflight_calls_total", "Coalesced calls by group and role (leader ran it, shared waited)", ["group", "role"])
+SINGLEFLIGHT_WAIT = Histogram("singleflight_wait_seconds", "Time followers waited for the leader's result", ["group"])
+
+class _Call:
+    __slots__ = ("done", "result", "error", "followers")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one execution"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Run fn for key, or wait for an identical call already in flight and share its outcome"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.followers += 1
+
+        if leader:
+            SINGLEFLIGHT_CALLS.inc(group=self.name, role="leader")
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        else:
+            SINGLEFLIGHT_CALLS.inc(group=self.name, role="shared")
+            start = time.perf_counter()
+            call.done.wait()
+            SINGLEFLIGHT_WAIT.observe(time.perf_counter() - start, group=self.name)
+
+        if call.error is not None:
+            raise call.error
+        # Followers get their own copy so one caller's edits can't leak into another's
+        return call.result if leader else copy.deepcopy(call.result)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self) -> Dict[str, Any]:
+        """Leader/shared counts and follower wait time for this group"""
+        leaders = SINGLEFLIGHT_CALLS.value(group=self.name, role="leader")
+        shared = SINGLEFLIGHT_CALLS.value(group=self.name, role="shared")
+        total = leaders + shared
+        return {
+            "leaders": leaders,
+            "shared": shared,
+            "shared_ratio": shared / total if total else 0.0,
+            "in_flight": self.in_flight(),
+        }
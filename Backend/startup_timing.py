@@ -0,0 +1,75 @@
+import builtins
+import importlib
+import sys
+import threading
+import time
+from typing import Dict, Any, List
+
+# Module-level state so the report survives for the lifetime of the worker
+_process_start = time.perf_counter()
+_original_import = builtins.__import__
+_import_depth = threading.local()
+_lock = threading.Lock()
+
+import_timings: Dict[str, float] = {}  # Top-level module -> seconds spent importing at startup
+lazy_timings: Dict[str, float] = {}  # Deferred loads (heavy modules, model) -> seconds
+startup_seconds = None
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    """Wrap __import__ and charge each outermost new import to its top-level module"""
+    depth = getattr(_import_depth, "value", 0)
+    if depth > 0 or level != 0 or name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+
+    _import_depth.value = depth + 1
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        _import_depth.value = depth
+        top_level = name.partition(".")[0]
+        with _lock:
+            import_timings[top_level] = import_timings.get(top_level, 0.0) + time.perf_counter() - start
+
+def begin():
+    """Start timing imports made while the app module loads"""
+    builtins.__import__ = _timed_import
+
+def end():
+    """Stop timing imports and record how long startup took"""
+    global startup_seconds
+    builtins.__import__ = _original_import
+    startup_seconds = time.perf_counter() - _process_start
+
+def record(name: str, seconds: float):
+    """Record a deferred load such as the embedding model"""
+    with _lock:
+        lazy_timings[name] = seconds
+
+def lazy_import(module_name: str):
+    """Import a heavy module on first use and record how long it took"""
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    with _lock:
+        lazy_timings.setdefault(f"import:{module_name}", time.perf_counter() - start)
+    return module
+
+def report() -> Dict[str, Any]:
+    """Startup timing breakdown, slowest imports first"""
+    with _lock:
+        imports: List[Dict[str, Any]] = [
+            {"module": name, "seconds": round(seconds, 4)}
+            for name, seconds in sorted(import_timings.items(), key=lambda item: item[1], reverse=True)
+        ]
+        lazy = {name: round(seconds, 4) for name, seconds in lazy_timings.items()}
+
+    return {
+        "startup_seconds": round(startup_seconds, 4) if startup_seconds is not None else None,
+        "imports": imports,
+        "lazy_loads": lazy,
+        "heavy_modules_loaded": [m for m in ("torch", "sentence_transformers", "faiss", "onnxruntime") if m in sys.modules],
+    }
@@ -1,27 +1,58 @@
-import os
-import json
-from typing import List, Dict, Any, Optional
+import functools
+from typing import Iterator, List, Dict, Any, Optional
+import coordination
+import journal
+import collection_stats
 
 # File storage location
 MOVIES_FILE = "movies.json"
+CATALOG_STATS_FILE = "catalog_stats.json"  # Rollup of the guest movies
+
+def _movie_key(movie: Dict[str, Any]) -> str:
+    """Titles are unique per user, and among guest movies"""
+    return f"{movie.get('user_id') or ''}:{movie['title'].lower()}"
+
+def _catalog() -> journal.JournaledCollection:
+    return journal.collection(MOVIES_FILE, "catalog", _movie_key)
 
 def load_movies():
     """Read movie data from storage"""
-    if os.path.exists(MOVIES_FILE):
-        with open(MOVIES_FILE, "r") as f:
-            return json.load(f)
-    return []
+    return _catalog().load()
+
+def _stats_locked(func):
+    """Run a catalog change and its rollup update as one step, see collection_stats.lock"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with collection_stats.lock(CATALOG_STATS_FILE):
+            return func(*args, **kwargs)
+    return wrapper
 
+@_stats_locked
 def save_movies(movies):
     """Write movie data to storage"""
-    with open(MOVIES_FILE, "w") as f:
-        json.dump(movies, f, indent=2)
+    _catalog().replace_all(movies)
+    coordination.bump(coordination.CATALOG)
+    collection_stats.replace(CATALOG_STATS_FILE, [movie for movie in movies if not movie.get("user_id")])
+
+def _guest_stats_changed(removed: List[Dict[str, Any]] = (), added: List[Dict[str, Any]] = ()):
+    """Keep the guest rollup in step; movies owned by users don't count"""
+    collection_stats.apply_changes(
+        CATALOG_STATS_FILE,
+        removed=[movie for movie in removed if not movie.get("user_id")],
+        added=[movie for movie in added if not movie.get("user_id")],
+    )
+
+def _save_movie(movie: Dict[str, Any], previous_key: Optional[str] = None):
+    """Record one changed movie without rewriting the catalog"""
+    _catalog().put(movie, replaces=previous_key)
+    coordination.bump(coordination.CATALOG)
 
 def get_user_movies(user_id: str) -> List[Dict[str, Any]]:
     """Retrieve movies belonging to a user"""
     all_movies = load_movies()
     return [movie for movie in all_movies if movie.get("user_id") == user_id]
 
+@_stats_locked
 def add_movie(movie_data: Dict[str, Any], user_id: Optional[str] = None) -> Dict[str, Any]:
     """Save a new movie entry"""
     movies = load_movies()
@@ -50,15 +81,18 @@ def add_movie(movie_data: Dict[str, Any], user_id: Optional[str] = None) -> Dict
             if movie["title"].lower() == movie_data["title"].lower():
                 if (user_id and movie.get("user_id") == user_id) or (not user_id and not movie.get("user_id")):
                     # Refresh movie data
+                    previous = dict(movie)
                     movies[i].update(movie_data)
-                    save_movies(movies)
+                    _save_movie(movies[i])
+                    _guest_stats_changed(removed=[previous], added=[movies[i]])
                     return movies[i]
     
     # Store new movie
-    movies.append(movie_data)
-    save_movies(movies)
+    _save_movie(movie_data)
+    _guest_stats_changed(added=[movie_data])
     return movie_data
 
+@_stats_locked
 def update_movie(movie_title: str, update_data: Dict[str, Any], user_id: Optional[str] = None) -> Dict[str, Any]:
     """Modify existing movie data"""
     movies = load_movies()
@@ -68,12 +102,15 @@ def update_movie(movie_title: str, update_data: Dict[str, Any], user_id: Optiona
         if movie["title"].lower() == movie_title.lower():
             if user_id is None or movie.get("user_id") == user_id:
                 # Apply changes
+                previous = dict(movie)
                 movies[i].update(update_data)
-                save_movies(movies)
+                _save_movie(movies[i], _movie_key(previous))
+                _guest_stats_changed(removed=[previous], added=[movies[i]])
                 return movies[i]
     
     return {"error": "Movie not found"}
 
+@_stats_locked
 def delete_movie(movie_title: str, user_id: Optional[str] = None) -> Dict[str, Any]:
     """Remove a movie entry"""
     movies = load_movies()
@@ -84,7 +121,35 @@ def delete_movie(movie_title: str, user_id: Optional[str] = None) -> Dict[str, A
             if user_id is None or movie.get("user_id") == user_id:
                 # Delete entry
                 deleted_movie = movies.pop(i)
-                save_movies(movies)
+                _catalog().delete(_movie_key(deleted_movie))
+                coordination.bump(coordination.CATALOG)
+                _guest_stats_changed(removed=[deleted_movie])
                 return {"message": f"Movie '{deleted_movie['title']}' deleted successfully"}
     
     return {"error": "Movie not found"}
+
+def export_guest_movies() -> Iterator[Dict[str, Any]]:
+    """Guest movies one at a time for streaming, without copying the catalog"""
+    return (movie for movie in _catalog().records() if not movie.get("user_id"))
+
+@_stats_locked
+def import_guest_movies(movies: List[Dict[str, Any]]) -> int:
+    """Add or replace a batch of guest movies with one write"""
+    for movie in movies:
+        movie.pop("user_id", None)
+    # Later lines for the same title win, as they would applied one by one
+    batch = list({_movie_key(movie): movie for movie in movies}.values())
+    existing = {_movie_key(movie): movie for movie in _catalog().records()}
+    replaced = [existing[_movie_key(movie)] for movie in batch if _movie_key(movie) in existing]
+    _catalog().put_many(batch)
+    coordination.bump(coordination.CATALOG)
+    _guest_stats_changed(removed=replaced, added=batch)
+    return len(movies)
+
+def get_guest_stats() -> Dict[str, Any]:
+    """Aggregates over the guest catalog, kept up to date by every change"""
+    return collection_stats.read(CATALOG_STATS_FILE, export_guest_movies)
+
+def rebuild_guest_stats() -> Dict[str, Any]:
+    """Recompute the guest rollup from the catalog"""
+    return collection_stats.rebuild(CATALOG_STATS_FILE, export_guest_movies)
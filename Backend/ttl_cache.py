@@ -0,0 +1,108 @@
+import contextvars
+import threading
+import time
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Hashable, Optional
+
+from metrics import CACHE_REQUESTS, Gauge
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Shared by every cache for stale-while-revalidate refreshes
+_refresh_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-refresh")
+
+CACHE_ENTRIES = Gauge("cache_entries", "Entries currently held by each TTL cache", ["cache"])
+
+class TTLCache:
+    """Size-bounded LRU cache whose entries go stale after ttl and expire after ttl + stale_ttl
+
+    Stale entries are still served while a background refresh replaces them.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float, stale_ttl: float = 0.0):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (value, stored_at)
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._flights = SingleFlight(f"cache:{name}")
+
+    def _record(self, result: str):
+        CACHE_REQUESTS.inc(cache=self.name, result=result)
+
+    def _lookup(self, key: Hashable):
+        """(value, age) for a live or stale entry, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            age = time.monotonic() - entry[1]
+            if age >= self.ttl + self.stale_ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0], age
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            CACHE_ENTRIES.set(len(self._entries), cache=self.name)
+
+    def peek(self, key: Hashable, allow_stale: bool = True) -> Optional[Any]:
+        """Cached value without computing anything"""
+        found = self._lookup(key)
+        if found is None or (not allow_stale and found[1] >= self.ttl):
+            return None
+        return found[0]
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any],
+                       should_cache: Callable[[Any], bool] = lambda value: True) -> Any:
+        """Serve from cache, refreshing stale entries in the background, or compute on a miss"""
+        found = self._lookup(key)
+        if found is not None:
+            value, age = found
+            if age < self.ttl:
+                self._record("hit")
+            else:
+                self._record("stale")
+                self._refresh_in_background(key, compute, should_cache)
+            return value
+
+        self._record("miss")
+        # Concurrent misses for the same key compute once
+        return self._flights.do(key, lambda: self._compute_and_store(key, compute, should_cache))
+
+    def _compute_and_store(self, key, compute, should_cache):
+        value = compute()
+        if should_cache(value):
+            self.set(key, value)
+        return value
+
+    def _refresh_in_background(self, key, compute, should_cache):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._compute_and_store(key, compute, should_cache)
+            except Exception:
+                logger.exception("Background cache refresh failed", extra={"cache": self.name})
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        _refresh_pool.submit(contextvars.copy_context().run, refresh)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -1,9 +1,15 @@
+import functools
 import os
 import json
 import uuid
 from datetime import datetime
 from typing import List, Dict, Any, Optional
 from passlib.context import CryptContext
+from metrics import Histogram
+import coordination
+import journal
+import collection_stats
+import notes_index
 
 # Storage locations
 USERS_FILE = "users.json"
@@ -12,41 +18,68 @@ USER_MOVIES_DIR = "user_movies"
 # Security setup
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+BCRYPT_LATENCY = Histogram("bcrypt_duration_seconds", "Password hashing and verification time", ["operation"])
+
+def _title_key(movie: Dict[str, Any]) -> str:
+    return movie["title"].lower()
+
+def _users() -> journal.JournaledCollection:
+    return journal.collection(USERS_FILE, "users", lambda user: user["id"])
+
+def _movies(user_id: str) -> journal.JournaledCollection:
+    return journal.collection(os.path.join(USER_MOVIES_DIR, user_id, "movies.json"), "user_movies", _title_key)
+
+def _stats_path(user_id: str) -> str:
+    return os.path.join(USER_MOVIES_DIR, user_id, "stats.json")
+
+def _stats_locked(func):
+    """Run a change to user's collection and its stats update as one step, see collection_stats.lock"""
+    @functools.wraps(func)
+    def wrapper(user_id: str, *args, **kwargs):
+        with collection_stats.lock(_stats_path(user_id)):
+            return func(user_id, *args, **kwargs)
+    return wrapper
+
 def load_users():
     """Read user accounts from storage"""
-    if os.path.exists(USERS_FILE):
-        with open(USERS_FILE, "r") as f:
-            return json.load(f)
-    return []
+    return _users().load()
 
 def save_users(users):
     """Write user accounts to storage"""
-    with open(USERS_FILE, "w") as f:
-        json.dump(users, f, indent=2)
+    _users().replace_all(users)
+    coordination.bump(coordination.USERS)
+
+def _build_user_lookup():
+    """Index accounts by username and id"""
+    users = load_users()
+    return {
+        "by_username": {user["username"]: user for user in users},
+        "by_id": {user["id"]: user for user in users},
+    }
+
+# Every authenticated request looks up its user, so keep them in memory
+# and reload only when some worker saves users.json
+_user_lookup = coordination.GenerationCache(coordination.USERS, _build_user_lookup)
 
 def get_user(username: str):
     """Find user account by username"""
-    users = load_users()
-    for user in users:
-        if user["username"] == username:
-            return user
-    return None
+    user = _user_lookup.get()["by_username"].get(username)
+    return dict(user) if user else None
 
 def get_user_by_id(user_id: str):
     """Find user account by ID"""
-    users = load_users()
-    for user in users:
-        if user["id"] == user_id:
-            return user
-    return None
+    user = _user_lookup.get()["by_id"].get(user_id)
+    return dict(user) if user else None
 
 def verify_password(plain_password, hashed_password):
     """Check if password is correct"""
-    return pwd_context.verify(plain_password, hashed_password)
+    with BCRYPT_LATENCY.time(operation="verify"):
+        return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password):
     """Securely hash a password"""
-    return pwd_context.hash(password)
+    with BCRYPT_LATENCY.time(operation="hash"):
+        return pwd_context.hash(password)
 
 def create_user(email: str, username: str, password: str):
     """Register a new user account"""
@@ -71,8 +104,8 @@ def create_user(email: str, username: str, password: str):
         "created_at": datetime.utcnow().isoformat()
     }
     
-    users.append(new_user)
-    save_users(users)
+    _users().put(new_user)
+    coordination.bump(coordination.USERS)
     
     # Set up storage for user's movies
     ensure_user_movies_dir(user_id)
@@ -101,12 +134,9 @@ def ensure_user_movies_dir(user_id: str):
 
 def get_user_movies(user_id: str) -> List[Dict[str, Any]]:
     """Load user's movie collection"""
-    user_movies_file = os.path.join(USER_MOVIES_DIR, user_id, "movies.json")
-    if os.path.exists(user_movies_file):
-        with open(user_movies_file, "r") as f:
-            return json.load(f)
-    return []
+    return _movies(user_id).load()
 
+@_stats_locked
 def add_user_movie(user_id: str, movie_data: Dict[str, Any]) -> Dict[str, Any]:
     """Save a movie to user's collection"""
     movies = get_user_movies(user_id)
@@ -118,34 +148,51 @@ def add_user_movie(user_id: str, movie_data: Dict[str, Any]) -> Dict[str, Any]:
         # Update existing entry
         for i, movie in enumerate(movies):
             if movie["title"].lower() == movie_data["title"].lower():
+                previous = dict(movie)
                 movies[i].update(movie_data)
-                save_user_movies(user_id, movies)
+                generation = _save_user_movie(user_id, movies[i])
+                collection_stats.apply_changes(_stats_path(user_id), removed=[previous], added=[movies[i]])
+                notes_index.movie_saved(user_id, generation, movies[i])
                 return movies[i]
     
     # Add new movie
-    movies.append(movie_data)
-    save_user_movies(user_id, movies)
+    generation = _save_user_movie(user_id, movie_data)
+    collection_stats.apply_changes(_stats_path(user_id), added=[movie_data])
+    notes_index.movie_saved(user_id, generation, movie_data)
     return movie_data
 
+@_stats_locked
 def save_user_movies(user_id: str, movies: List[Dict[str, Any]]):
     """Write movie collection to storage"""
     ensure_user_movies_dir(user_id)
-    user_movies_file = os.path.join(USER_MOVIES_DIR, user_id, "movies.json")
-    with open(user_movies_file, "w") as f:
-        json.dump(movies, f, indent=2)
+    _movies(user_id).replace_all(movies)
+    coordination.bump(coordination.user_topic(user_id))
+    collection_stats.replace(_stats_path(user_id), movies)
+
+def _save_user_movie(user_id: str, movie: Dict[str, Any], previous_title: Optional[str] = None) -> int:
+    """Record one changed movie without rewriting the collection; returns the new generation"""
+    ensure_user_movies_dir(user_id)
+    _movies(user_id).put(movie, replaces=previous_title.lower() if previous_title else None)
+    return coordination.bump(coordination.user_topic(user_id))
 
+@_stats_locked
 def update_user_movie(user_id: str, movie_title: str, update_data: Dict[str, Any]) -> Dict[str, Any]:
     """Modify a movie in user's collection"""
     movies = get_user_movies(user_id)
     
     for i, movie in enumerate(movies):
         if movie["title"].lower() == movie_title.lower():
+            previous = dict(movie)
+            previous_title = movie["title"]
             movies[i].update(update_data)
-            save_user_movies(user_id, movies)
+            generation = _save_user_movie(user_id, movies[i], previous_title)
+            collection_stats.apply_changes(_stats_path(user_id), removed=[previous], added=[movies[i]])
+            notes_index.movie_saved(user_id, generation, movies[i], previous_title=previous_title)
             return movies[i]
     
     return {"error": "Movie not found"}
 
+@_stats_locked
 def delete_user_movie(user_id: str, movie_title: str) -> Dict[str, Any]:
     """Remove a movie from user's collection"""
     movies = get_user_movies(user_id)
@@ -153,7 +200,40 @@ def delete_user_movie(user_id: str, movie_title: str) -> Dict[str, Any]:
     for i, movie in enumerate(movies):
         if movie["title"].lower() == movie_title.lower():
             deleted_movie = movies.pop(i)
-            save_user_movies(user_id, movies)
+            _movies(user_id).delete(_title_key(deleted_movie))
+            generation = coordination.bump(coordination.user_topic(user_id))
+            collection_stats.apply_changes(_stats_path(user_id), removed=[deleted_movie])
+            notes_index.movie_deleted(user_id, generation, deleted_movie["title"])
             return {"message": f"Movie '{deleted_movie['title']}' deleted successfully"}
     
     return {"error": "Movie not found"}
+
+def export_user_movies(user_id: str) -> List[Dict[str, Any]]:
+    """User's movies for streaming out; shared with the loaded collection, don't modify them"""
+    return _movies(user_id).records()
+
+@_stats_locked
+def import_user_movies(user_id: str, movies: List[Dict[str, Any]]) -> int:
+    """Add or replace a batch of movies in user's collection with one write"""
+    ensure_user_movies_dir(user_id)
+    for movie in movies:
+        movie.pop("user_id", None)
+    # Later lines for the same title win, as they would applied one by one
+    batch = list({_title_key(movie): movie for movie in movies}.values())
+    collection = _movies(user_id)
+    existing = {_title_key(movie): movie for movie in collection.records()}
+    replaced = [existing[_title_key(movie)] for movie in batch if _title_key(movie) in existing]
+    collection.put_many(batch)
+    # The notes index sees the new generation and rebuilds on next search
+    coordination.bump(coordination.user_topic(user_id))
+    collection_stats.apply_changes(_stats_path(user_id), removed=replaced, added=batch)
+    return len(movies)
+
+def get_user_stats(user_id: str) -> Dict[str, Any]:
+    """Aggregates over user's collection, kept up to date by every change"""
+    return collection_stats.read(_stats_path(user_id), lambda: get_user_movies(user_id))
+
+def rebuild_user_stats(user_id: str) -> Dict[str, Any]:
+    """Recompute user's aggregates from their collection"""
+    ensure_user_movies_dir(user_id)
+    return collection_stats.rebuild(_stats_path(user_id), lambda: get_user_movies(user_id))
@@ -1,53 +1,197 @@
 import os
-import json
+import time
+import shutil
+import hashlib
+import threading
+import logging
 import numpy as np
 import faiss
-from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, NamedTuple
+from embedding_backends import EMBEDDING_BACKEND, load_backend
+import startup_timing
+import coordination
+import fast_json
+from metrics import Histogram, STORAGE_LATENCY, STORAGE_BYTES, cache_hit, cache_miss
+from profiling import span
+
+logger = logging.getLogger(__name__)
 
 # Model configuration
 MODEL_NAME = "all-MiniLM-L6-v2"  # Using a lightweight model that works well for this use case
 VECTOR_DIMENSION = 384
 INDEX_FILE = "movie_vectors.faiss"
 MOVIE_EMBEDDINGS_FILE = "movie_embeddings.json"
+NEIGHBORS_FILE = "movie_neighbors.npz"
+# Each reindex writes the files above into its own directory here, then
+# INDEX_POINTER is swapped to name it, so readers never mix two reindexes
+INDEX_VERSIONS_DIR = "index_versions"
+INDEX_POINTER = "index_current"
+INDEX_KEEP_VERSIONS = 2  # The previous one stays for workers still opening it
+
+# Neighbour graph for similar-movie lookups
+NEIGHBOR_K = int(os.environ.get("NEIGHBOR_K", "20"))
+NEIGHBOR_BATCH_SIZE = 1024  # Query vectors per index.search call while building
+
+EMBEDDING_LATENCY = Histogram("embedding_duration_seconds", "Time spent encoding text", ["mode"])
+FAISS_SEARCH_LATENCY = Histogram("faiss_search_duration_seconds", "Time spent in FAISS index.search")
 
 # Initialize the model
 model = None
+_model_lock = threading.Lock()
 
 def get_model():
     """Load the model only when needed to save memory"""
     global model
-    if model is None:
-        print(f"Loading model: {MODEL_NAME}")
-        model = SentenceTransformer(MODEL_NAME)
+    if model is not None:
+        cache_hit("embedding_model")
+    else:
+        cache_miss("embedding_model")
+        # Warmup thread and first request may race here, only one loads
+        with _model_lock:
+            if model is None:
+                logger.info("Loading model", extra={"model": MODEL_NAME, "backend": EMBEDDING_BACKEND})
+                start = time.perf_counter()
+                with span("model_load"):
+                    model = load_backend(MODEL_NAME)
+                startup_timing.record("model_load", time.perf_counter() - start)
     return model
 
 def create_embedding(text: str) -> np.ndarray:
     """Generate vector embedding for a single text input"""
-    return get_model().encode(text, show_progress_bar=False)
+    encoder = get_model()
+    with span("create_embedding"), EMBEDDING_LATENCY.time(mode="single"):
+        return encoder.encode(text, show_progress_bar=False)
 
-def create_embeddings(texts: List[str]) -> np.ndarray:
+def create_embeddings(texts: List[str], show_progress_bar: bool = True) -> np.ndarray:
     """Generate vector embeddings for multiple texts at once"""
-    return get_model().encode(texts, show_progress_bar=True)
+    encoder = get_model()
+    with span("create_embeddings", count=len(texts)), EMBEDDING_LATENCY.time(mode="batch"):
+        return encoder.encode(texts, show_progress_bar=show_progress_bar)
+
+def _text_hash(text: str) -> str:
+    """Identifies a stored vector; includes the encoder so switching backend or model re-embeds everything"""
+    return hashlib.sha1(f"{EMBEDDING_BACKEND}:{MODEL_NAME}\n{text}".encode("utf-8")).hexdigest()[:16]
+
+def _reuse_or_embed(texts: List[str], hashes: List[str], previous: Optional["LoadedIndex"]):
+    """Embeddings for texts, copying stored vectors for unchanged texts instead of re-encoding
+
+    Returns the embedding matrix and, per new id, the old vector id it was copied from (or None).
+    """
+    old_vectors = None
+    old_by_hash: Dict[str, int] = {}
+    if previous is not None and previous.index.ntotal:
+        old_vectors = previous.index.reconstruct_n(0, previous.index.ntotal)
+        for movie_data in previous.embeddings_map.values():
+            text_hash = movie_data.get('text_hash')
+            if text_hash and movie_data['id'] < previous.index.ntotal:
+                old_by_hash.setdefault(text_hash, movie_data['id'])
+    
+    reused_from = [old_by_hash.get(text_hash) for text_hash in hashes]
+    embeddings = np.zeros((len(texts), VECTOR_DIMENSION), dtype='float32')
+    missing = []
+    for i, old_id in enumerate(reused_from):
+        if old_id is None:
+            missing.append(i)
+        else:
+            embeddings[i] = old_vectors[old_id]
+    
+    logger.info("Creating embeddings", extra={"count": len(missing), "reused": len(texts) - len(missing)})
+    if missing:
+        embeddings[missing] = np.asarray(create_embeddings([texts[i] for i in missing]), dtype='float32')
+    return embeddings, reused_from
+
+def _search_excluding_self(index, vectors: np.ndarray, row_ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """k nearest neighbours of each vector, leaving out the vector's own id"""
+    distances, indices = index.search(vectors, k + 1)
+    out_ids = np.empty((len(vectors), k), dtype='int64')
+    out_distances = np.empty((len(vectors), k), dtype='float32')
+    for row in range(len(vectors)):
+        keep = indices[row] != row_ids[row]
+        out_ids[row] = indices[row][keep][:k]
+        out_distances[row] = distances[row][keep][:k]
+    return out_ids, out_distances
+
+def _full_neighbor_graph(index, embeddings: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Batched all-pairs kNN over the whole catalog"""
+    ids, distances = [], []
+    for start in range(0, len(embeddings), NEIGHBOR_BATCH_SIZE):
+        batch = embeddings[start:start + NEIGHBOR_BATCH_SIZE]
+        batch_ids, batch_distances = _search_excluding_self(index, batch, np.arange(start, start + len(batch)), k)
+        ids.append(batch_ids)
+        distances.append(batch_distances)
+    return np.vstack(ids), np.vstack(distances)
+
+def _neighbor_graph(index, embeddings: np.ndarray, reused_from: List[Optional[int]],
+                    previous: Optional["LoadedIndex"]) -> Tuple[np.ndarray, np.ndarray]:
+    """Neighbour lists for every movie, updated in place when movies were only added"""
+    k = min(NEIGHBOR_K, len(embeddings) - 1)
+    if k <= 0:
+        return np.zeros((len(embeddings), 0), dtype='int64'), np.zeros((len(embeddings), 0), dtype='float32')
+    
+    carried = [old_id for old_id in reused_from if old_id is not None]
+    old_graph = previous.neighbors if previous is not None else None
+    additions_only = (
+        old_graph is not None
+        and old_graph[0].shape == (previous.index.ntotal, k)
+        and sorted(carried) == list(range(previous.index.ntotal))
+    )
+    if not additions_only:
+        return _full_neighbor_graph(index, embeddings, k)
+    
+    # Carry old lists over to the new ids
+    old_to_new = np.empty(previous.index.ntotal, dtype='int64')
+    carried_rows, added_rows = [], []
+    for new_id, old_id in enumerate(reused_from):
+        if old_id is None:
+            added_rows.append(new_id)
+        else:
+            old_to_new[old_id] = new_id
+            carried_rows.append(new_id)
+    carried_rows = np.array(carried_rows, dtype='int64')
+    added_rows = np.array(added_rows, dtype='int64')
+    
+    ids = np.empty((len(embeddings), k), dtype='int64')
+    distances = np.empty((len(embeddings), k), dtype='float32')
+    ids[old_to_new] = old_to_new[old_graph[0]]
+    distances[old_to_new] = old_graph[1]
+    if len(added_rows) == 0:
+        return ids, distances
+    
+    # New movies search the whole index
+    ids[added_rows], distances[added_rows] = _search_excluding_self(index, embeddings[added_rows], added_rows, k)
+    
+    # Existing movies only need to consider the new vectors
+    added = embeddings[added_rows]
+    added_norms = (added ** 2).sum(axis=1)
+    for start in range(0, len(carried_rows), NEIGHBOR_BATCH_SIZE):
+        rows = carried_rows[start:start + NEIGHBOR_BATCH_SIZE]
+        vectors = embeddings[rows]
+        cross = (vectors ** 2).sum(axis=1)[:, None] + added_norms[None, :] - 2 * vectors @ added.T
+        merged_distances = np.hstack([distances[rows], np.maximum(cross, 0).astype('float32')])
+        merged_ids = np.hstack([ids[rows], np.broadcast_to(added_rows, cross.shape)])
+        order = np.argsort(merged_distances, axis=1, kind='stable')[:, :k]
+        ids[rows] = np.take_along_axis(merged_ids, order, axis=1)
+        distances[rows] = np.take_along_axis(merged_distances, order, axis=1)
+    return ids, distances
 
 def index_movies(movies: List[Dict[str, Any]]) -> None:
     """Index movies for vector search and save to disk"""
     if not movies:
-        print("No movies to index")
+        logger.warning("No movies to index")
         return
     
     # Combine title and description for better semantic matching
     texts = [f"{movie['title']} {movie['description']}" for movie in movies]
+    hashes = [_text_hash(text) for text in texts]
     
-    print(f"Creating embeddings for {len(texts)} movies...")
-    embeddings = create_embeddings(texts)
+    previous = get_index()
+    embeddings, reused_from = _reuse_or_embed(texts, hashes, previous)
     
-    print("Creating FAISS index...")
     index = faiss.IndexFlatL2(VECTOR_DIMENSION)
-    index.add(np.array(embeddings).astype('float32'))
+    index.add(embeddings)
     
-    print(f"Saving index to {INDEX_FILE}")
-    faiss.write_index(index, INDEX_FILE)
+    # Precompute neighbour lists so similar-movie lookups never touch the model
+    neighbor_ids, neighbor_distances = _neighbor_graph(index, embeddings, reused_from, previous)
     
     # Store movie details with their vector IDs for later lookup
     embeddings_map = {
@@ -56,54 +200,214 @@ def index_movies(movies: List[Dict[str, Any]]) -> None:
             'title': movie['title'],
             'description': movie['description'],
             'rating': movie.get('rating', 0),
-            'watched': movie.get('watched', False)
+            'watched': movie.get('watched', False),
+            'text_hash': hashes[i]
         }
         for i, movie in enumerate(movies)
     }
     
-    with open(MOVIE_EMBEDDINGS_FILE, 'w') as f:
-        json.dump(embeddings_map, f, indent=2)
+    save_index(index, embeddings_map, (neighbor_ids, neighbor_distances))
+    
+    # Tell every worker to reload the index on its next search
+    coordination.bump(coordination.INDEX)
+    logger.info("Indexed movies", extra={"count": len(movies)})
+
+def _index_paths(version: Optional[str]) -> Tuple[str, str, str]:
+    """Index, embeddings map and neighbour files of a version (None for the old top-level files)"""
+    folder = os.path.join(INDEX_VERSIONS_DIR, version) if version else ""
+    return tuple(os.path.join(folder, name) for name in (INDEX_FILE, MOVIE_EMBEDDINGS_FILE, NEIGHBORS_FILE))
+
+def _current_version() -> Optional[str]:
+    try:
+        with open(INDEX_POINTER) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def _prune_versions(keep: str) -> None:
+    try:
+        versions = sorted(os.listdir(INDEX_VERSIONS_DIR), reverse=True)
+    except FileNotFoundError:
+        return
+    # .tmp directories belong to reindexes still being written
+    stale = [v for v in versions if v != keep and not v.endswith(".tmp")][INDEX_KEEP_VERSIONS - 1:]
+    for version in stale:
+        shutil.rmtree(os.path.join(INDEX_VERSIONS_DIR, version), ignore_errors=True)
+
+def save_index(index, embeddings_map: Dict[str, Dict[str, Any]],
+               neighbors: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> None:
+    """Write a complete index version, then publish it with one swap of the pointer file"""
+    version = f"{time.time_ns():020d}-{os.getpid()}"
+    building = f"{version}.tmp"
+    os.makedirs(os.path.join(INDEX_VERSIONS_DIR, building))
+    index_path, embeddings_path, neighbors_path = _index_paths(building)
+    
+    logger.info("Saving index", extra={"path": index_path})
+    with STORAGE_LATENCY.time(store="faiss_index", operation="write"):
+        faiss.write_index(index, index_path)
+        if neighbors is not None:
+            with open(neighbors_path, 'wb') as f:
+                np.savez(f, ids=neighbors[0].astype('int32'), distances=neighbors[1])
+        with open(embeddings_path, 'wb') as f:
+            fast_json.dump(embeddings_map, f)
+    STORAGE_BYTES.inc(sum(os.path.getsize(path) for path in _index_paths(building) if os.path.exists(path)),
+                      store="faiss_index", operation="write")
+    os.rename(os.path.join(INDEX_VERSIONS_DIR, building), os.path.join(INDEX_VERSIONS_DIR, version))
     
-    print(f"Indexed {len(movies)} movies successfully")
+    pointer_tmp = f"{INDEX_POINTER}.{version}.tmp"
+    with open(pointer_tmp, 'w') as f:
+        f.write(version)
+    os.replace(pointer_tmp, INDEX_POINTER)
+    _prune_versions(keep=version)
+
+class LoadedIndex(NamedTuple):
+    index: Any  # faiss index
+    embeddings_map: Dict[str, Dict[str, Any]]
+    movies_by_id: List[Optional[Tuple[str, Dict[str, Any]]]]  # Vector id -> (title, movie data)
+    ids_by_title: Dict[str, int]  # Lowercased title -> vector id
+    neighbors: Optional[Tuple[np.ndarray, np.ndarray]]  # Precomputed neighbour ids and distances per vector id
+
+def _read_faiss_index(path: str):
+    """Memory-map the index so workers share one read-only copy through the page cache"""
+    try:
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP)
+    except Exception:
+        # Index types without mmap support are read into memory
+        return faiss.read_index(path)
+
+def _read_neighbors(path: str, ntotal: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        ids, distances = data['ids'].astype('int64'), data['distances']
+    if ids.shape[0] != ntotal:
+        return None  # Left over from an older index
+    return ids, distances
+
+def _load_index() -> Optional[LoadedIndex]:
+    """Read the current index version from disk"""
+    index_path, embeddings_path, neighbors_path = _index_paths(_current_version())
+    if not os.path.exists(index_path) or not os.path.exists(embeddings_path):
+        return None
+    
+    with span("storage.load", store="faiss_index"), STORAGE_LATENCY.time(store="faiss_index", operation="read"):
+        index = _read_faiss_index(index_path)
+        with open(embeddings_path, 'rb') as f:
+            embeddings_map = fast_json.load(f)
+        neighbors = _read_neighbors(neighbors_path, index.ntotal)
+    STORAGE_BYTES.inc(os.path.getsize(index_path) + os.path.getsize(embeddings_path),
+                      store="faiss_index", operation="read")
+    
+    movies_by_id = [None] * max(index.ntotal, len(embeddings_map))
+    ids_by_title = {}
+    for title, movie_data in embeddings_map.items():
+        if 0 <= movie_data['id'] < len(movies_by_id):
+            movies_by_id[movie_data['id']] = (title, movie_data)
+            ids_by_title[title.lower()] = movie_data['id']
+    return LoadedIndex(index, embeddings_map, movies_by_id, ids_by_title, neighbors)
+
+# Loaded once per worker and reloaded when any worker reindexes
+_index_cache = coordination.GenerationCache(coordination.INDEX, _load_index)
+
+def get_index() -> Optional[LoadedIndex]:
+    """Current index for this worker, or None if nothing has been indexed"""
+    loaded = _index_cache.get()
+    if loaded is None and all(map(os.path.exists, _index_paths(_current_version())[:2])):
+        # Files were created without a generation bump (e.g. by a script)
+        _index_cache.invalidate()
+        loaded = _index_cache.get()
+    return loaded
 
 def search_movies(query: str, top_k: int = 5) -> List[Dict[str, Any]]:
     """Find movies that match the query semantically"""
-    if not os.path.exists(INDEX_FILE) or not os.path.exists(MOVIE_EMBEDDINGS_FILE):
-        print("Index files not found. Please index movies first.")
+    loaded = get_index()
+    if loaded is None:
+        logger.warning("Index files not found. Please index movies first.")
         return []
     
-    index = faiss.read_index(INDEX_FILE)
-    
-    with open(MOVIE_EMBEDDINGS_FILE, 'r') as f:
-        embeddings_map = json.load(f)
-    
     query_embedding = create_embedding(query)
     
     # Find nearest neighbors in vector space
-    distances, indices = index.search(np.array([query_embedding]).astype('float32'), top_k)
+    with span("index.search"), FAISS_SEARCH_LATENCY.time():
+        distances, indices = loaded.index.search(np.array([query_embedding]).astype('float32'), top_k)
     
     # Convert vector IDs back to movie data
     results = []
     for i, idx in enumerate(indices[0]):
-        if idx < 0 or idx >= len(embeddings_map):
+        if idx < 0 or idx >= len(loaded.movies_by_id) or loaded.movies_by_id[idx] is None:
             continue
             
         # Find the movie with this index
-        for title, movie_data in embeddings_map.items():
-            if movie_data['id'] == int(idx):
-                results.append({
-                    'title': title,
-                    'description': movie_data['description'],
-                    'rating': movie_data.get('rating', 0),
-                    'watched': movie_data.get('watched', False),
-                    'score': float(1.0 / (1.0 + distances[0][i]))  # Higher score = better match
-                })
-                break
+        title, movie_data = loaded.movies_by_id[idx]
+        results.append({
+            'title': title,
+            'description': movie_data['description'],
+            'rating': movie_data.get('rating', 0),
+            'watched': movie_data.get('watched', False),
+            'score': float(1.0 / (1.0 + distances[0][i]))  # Higher score = better match
+        })
     
     # Best matches first
     results.sort(key=lambda x: x['score'], reverse=True)
     return results
 
+def search_movies_batch(queries: List[str], top_k: int = 5) -> List[List[Dict[str, Any]]]:
+    """Ranked matches for each query, using one embedding batch and one index search"""
+    loaded = get_index()
+    if loaded is None:
+        logger.warning("Index files not found. Please index movies first.")
+        return [[] for _ in queries]
+    
+    # Repeated queries are encoded and searched once
+    unique = list(dict.fromkeys(queries))
+    embeddings = np.asarray(create_embeddings(unique, show_progress_bar=False), dtype='float32')
+    with span("index.search", count=len(unique)), FAISS_SEARCH_LATENCY.time():
+        distances, indices = loaded.index.search(embeddings, top_k)
+    
+    by_query = {}
+    for row, query in enumerate(unique):
+        results = [_result(loaded, int(idx), float(distance)) for idx, distance in zip(indices[row], distances[row])]
+        by_query[query] = [result for result in results if result is not None]  # Already best first
+    return [by_query[query] for query in queries]
+
 def recommend_movies(query: str, top_k: int = 5) -> List[Dict[str, Any]]:
     """Find movies matching a vague description or theme"""
     return search_movies(query, top_k)
+
+def _result(loaded: LoadedIndex, movie_id: int, distance: float) -> Optional[Dict[str, Any]]:
+    if movie_id < 0 or movie_id >= len(loaded.movies_by_id) or loaded.movies_by_id[movie_id] is None:
+        return None
+    title, movie_data = loaded.movies_by_id[movie_id]
+    return {
+        'title': title,
+        'description': movie_data['description'],
+        'rating': movie_data.get('rating', 0),
+        'watched': movie_data.get('watched', False),
+        'score': float(1.0 / (1.0 + distance))
+    }
+
+def similar_movies(title: str, top_k: int = 5) -> Optional[List[Dict[str, Any]]]:
+    """Movies closest to an indexed movie, or None if the title isn't indexed"""
+    loaded = get_index()
+    if loaded is None:
+        return None
+    movie_id = loaded.ids_by_title.get(title.lower())
+    if movie_id is None:
+        return None
+    top_k = min(top_k, loaded.index.ntotal - 1)
+    if top_k < 1:
+        return []
+    
+    if loaded.neighbors is not None and top_k <= loaded.neighbors[0].shape[1]:
+        # Precomputed graph, no model and no index search
+        neighbor_ids = loaded.neighbors[0][movie_id][:top_k]
+        neighbor_distances = loaded.neighbors[1][movie_id][:top_k]
+    else:
+        # Reuse the stored vector instead of re-embedding the description
+        vector = loaded.index.reconstruct(movie_id).reshape(1, -1)
+        with span("index.search"), FAISS_SEARCH_LATENCY.time():
+            ids, distances = _search_excluding_self(loaded.index, vector, np.array([movie_id]), top_k)
+        neighbor_ids, neighbor_distances = ids[0], distances[0]
+    
+    results = [_result(loaded, int(i), float(d)) for i, d in zip(neighbor_ids, neighbor_distances)]
+    return [result for result in results if result is not None]